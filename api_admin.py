@@ -5,7 +5,6 @@ from flask import Blueprint, jsonify, request, session
 from database import db
 from functools import wraps
 import os
-from werkzeug.utils import secure_filename
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -80,21 +79,20 @@ def check_login():
 def get_stats():
     """获取管理员统计数据"""
     from models_admin import Project
-    from datetime import datetime, timedelta
+    from datetime import datetime
     
     try:
-        # 导入Visitor模型
-        from app import Visitor
+        # 访问量从汇总表读取
+        from models_visitor import count_visits
         
         # 总访问量
-        total_visitors = Visitor.query.count()
+        total_visitors = count_visits()
         
         # 首页访问量
-        home_visitors = Visitor.query.filter_by(page='/').count()
+        home_visitors = count_visits(page='/')
         
-        # 今日访问量（最近24小时）
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        today_visitors = Visitor.query.filter(Visitor.visit_time >= yesterday).count()
+        # 今日访问量（按天汇总表中今天的行，UTC 日期，与访问时间的记录方式一致）
+        today_visitors = count_visits(day=datetime.utcnow().date())
         
         # 项目总数
         total_projects = Project.query.count()
@@ -177,33 +175,150 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': '不支持的文件类型'}), 400
         
-        # 确保上传目录存在
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        # 流式保存并按内容哈希去重；图片的缩放图和 WebP 由后台生成
+        from media_pipeline import save_upload
+        media = save_upload(file, UPLOAD_FOLDER, '/static/uploads')
         
-        # 保存文件
-        filename = secure_filename(file.filename)
-        # 添加时间戳避免重名
-        import time
-        timestamp = str(int(time.time()))
-        name, ext = os.path.splitext(filename)
-        filename = f"{name}_{timestamp}{ext}"
+        return jsonify({
+            'message': '上传成功',
+            'path': media.url,
+            'filename': os.path.basename(media.url),
+            'media': media.to_dict()
+        }), 200
         
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/uploads', methods=['POST'])
+@login_required
+def init_chunked_upload():
+    """
+    创建分块上传（用于大文件）
+    JSON: filename, size (字节), chunk_size (可选，默认5MB), sha256 (可选，整个文件的校验值)
+    之后依次 PUT /uploads/<upload_id>/chunks/<序号>，最后 POST /uploads/<upload_id>/complete
+    """
+    import chunked_upload
+    
+    try:
+        data = request.get_json() or {}
+        filename = (data.get('filename') or '').strip()
+        if not filename:
+            return jsonify({'error': '文件名为空'}), 400
+        if not allowed_file(filename):
+            return jsonify({'error': '不支持的文件类型'}), 400
         
-        # 返回 /static/ 路径（兼容两种访问方式）
-        relative_path = f"/static/uploads/{filename}"
+        upload = chunked_upload.create_session(
+            filename, data.get('size'), data.get('chunk_size'), data.get('sha256')
+        )
+        return jsonify(upload.to_dict(received=[])), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_chunked_upload(upload_id):
+    """查询上传进度，received 为已收到的分块序号（断线后据此续传）"""
+    from models_media import UploadSession
+    import chunked_upload
+    
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    return jsonify(upload.to_dict(received=chunked_upload.received_chunks(upload)))
+
+
+@admin_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id, index):
+    """
+    上传一个分块，请求体为该块的原始字节
+    请求头 X-Chunk-Sha256 (可选): 该块的 sha256，不一致时返回 400，客户端应重传该块
+    """
+    from models_media import UploadSession
+    import chunked_upload
+    
+    try:
+        upload = db.session.get(UploadSession, upload_id)
+        if upload is None:
+            return jsonify({'error': '上传不存在或已过期'}), 404
         
+        checksum = chunked_upload.write_chunk(
+            upload, index, request.stream, request.content_length,
+            request.headers.get('X-Chunk-Sha256')
+        )
+        return jsonify({'index': index, 'sha256': checksum})
+    except chunked_upload.UploadInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    """拼接全部分块，返回格式与 /upload 相同；同一上传已在拼接时返回 409"""
+    from models_media import UploadSession
+    import chunked_upload
+    
+    try:
+        upload = db.session.get(UploadSession, upload_id)
+        if upload is None:
+            return jsonify({'error': '上传不存在或已过期'}), 404
+        
+        media = chunked_upload.assemble(upload, UPLOAD_FOLDER, '/static/uploads')
         return jsonify({
             'message': '上传成功',
-            'path': relative_path,
-            'filename': filename
+            'path': media.url,
+            'filename': os.path.basename(media.url),
+            'media': media.to_dict()
         }), 200
-        
+    except chunked_upload.UploadInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_chunked_upload(upload_id):
+    """取消上传并删除已上传的分块"""
+    from models_media import UploadSession
+    import chunked_upload
+    
+    try:
+        upload = db.session.get(UploadSession, upload_id)
+        if upload is None:
+            return jsonify({'error': '上传不存在或已过期'}), 404
+        if upload.status != chunked_upload.UPLOADING:
+            return jsonify({'error': '上传正在完成，不能取消'}), 409
+        chunked_upload.discard(upload)
+        return jsonify({'message': '已取消'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/media/<int:media_id>', methods=['GET'])
+@login_required
+def get_media(media_id):
+    """查询上传文件的处理状态和缩放图（srcset）"""
+    from models_media import MediaFile
+    
+    try:
+        media = MediaFile.query.get_or_404(media_id)
+        return jsonify(media.to_dict())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+
 @admin_bp.route('/projects', methods=['GET'])
 def get_projects():
     """获取所有项目（管理员可见所有，普通用户只看可见的）"""
@@ -219,8 +334,9 @@ def get_projects():
             projects = Project.query.filter_by(is_visible=True)\
                 .order_by(Project.order_index.desc(), Project.created_at.desc()).all()
         
+        from media_pipeline import attach_srcsets
         response = make_response(jsonify({
-            'projects': [p.to_dict() for p in projects]
+            'projects': attach_srcsets([p.to_dict() for p in projects])
         }), 200)
         
         # 添加缓存头（公开项目缓存60秒，管理员不缓存）
@@ -268,6 +384,11 @@ def create_project():
         )
         
         db.session.add(project)
+        db.session.flush()  # 获取项目ID
+        
+        from search_index import index_project
+        index_project(project)
+        
         db.session.commit()
         
         return jsonify({
@@ -308,6 +429,9 @@ def update_project(project_id):
         if 'is_visible' in data:
             project.is_visible = data['is_visible']
         
+        from search_index import index_project
+        index_project(project)
+        
         db.session.commit()
         
         return jsonify({
@@ -332,6 +456,10 @@ def delete_project(project_id):
             return jsonify({'error': '项目不存在'}), 404
         
         db.session.delete(project)
+        
+        from search_index import remove_project
+        remove_project(project_id)
+        
         db.session.commit()
         
         return jsonify({'message': '项目删除成功'}), 200
@@ -1,8 +1,10 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, jsonify, request, session, current_app
 from functools import wraps
+from collections import OrderedDict
+import hashlib
 import os
-from werkzeug.utils import secure_filename
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 
 blog_bp = Blueprint('blog', __name__, url_prefix='/api/blog')
 
@@ -28,64 +30,382 @@ def get_db_models():
     from app import db, BlogPost
     return db, BlogPost
 
+# 文章列表缓存（LRU）: (指纹, 查询参数) -> 序列化后的响应体
+# 指纹为 blog_listing_version 表中的 (版本号, 修改时间)，文章增删改时在同一事务中加一，
+# 其他进程的修改也能通过指纹发现；本进程的修改直接清空缓存
+# 查询参数来自请求，限制条数避免被任意参数撑大
+LISTING_CACHE_SIZE = 128
+_listing_cache = OrderedDict()
+_listing_cache_lock = threading.Lock()
+
+def invalidate_listing_cache():
+    with _listing_cache_lock:
+        _listing_cache.clear()
+
+def _cache_get(key):
+    """读取缓存并标记为最近使用（需持有锁）"""
+    value = _listing_cache.get(key)
+    if value is not None:
+        _listing_cache.move_to_end(key)
+    return value
+
+def _cache_put(key, value):
+    """写入缓存，超出容量时淘汰最久未使用的条目（需持有锁）"""
+    _listing_cache[key] = value
+    _listing_cache.move_to_end(key)
+    while len(_listing_cache) > LISTING_CACHE_SIZE:
+        _listing_cache.popitem(last=False)
+
+def get_listing_fingerprint():
+    """返回 (列表版本号, 最后修改时间)，按主键读取一行"""
+    from models_blog import get_listing_version
+    return get_listing_version()
+
+def cached_listing_response(key, build):
+    """
+    按指纹缓存文章列表响应，支持 ETag/Last-Modified 条件请求
+
+    Args:
+        key: 查询参数组成的缓存键
+        build: build(fingerprint)，返回要序列化的数据
+    """
+    version, last_modified = get_listing_fingerprint()
+    fingerprint = (version, last_modified)
+    stamp = int(last_modified.timestamp() * 1000) if last_modified else 0
+    # 查询参数可能含引号等字符，取摘要放入 ETag
+    key_digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    etag = f'{stamp}-{version}-{key_digest}'
+    if last_modified:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    
+    not_modified = request.if_none_match.contains(etag) if request.if_none_match else (
+        last_modified is not None and request.if_modified_since is not None
+        and last_modified.replace(microsecond=0) <= request.if_modified_since
+    )
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        with _listing_cache_lock:
+            body = _cache_get((fingerprint, key))
+        if body is None:
+            body = current_app.json.dumps(build(fingerprint))
+            with _listing_cache_lock:
+                if any(k[0] != fingerprint for k in _listing_cache):
+                    _listing_cache.clear()
+                _cache_put((fingerprint, key), body)
+        response = current_app.response_class(body, mimetype='application/json')
+    
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+def get_published_total(fingerprint, query=None, filters=()):
+    """
+    已发布文章数，按指纹缓存，避免每次分页都执行 COUNT
+
+    Args:
+        query: 带筛选条件的查询，filters 为对应的缓存键
+    """
+    db, BlogPost = get_db_models()
+    key = (fingerprint, ('published_total',) + tuple(filters))
+    with _listing_cache_lock:
+        total = _cache_get(key)
+    if total is None:
+        if query is None:
+            query = BlogPost.query.filter_by(is_published=True)
+        total = query.order_by(None).count()
+        with _listing_cache_lock:
+            _cache_put(key, total)
+    return total
+
+def parse_cursor(cursor):
+    """解析 '<created_at>,<id>' 格式的游标"""
+    created_at, post_id = cursor.rsplit(',', 1)
+    return datetime.fromisoformat(created_at), int(post_id)
+
 # 公开接口
 
 @blog_bp.route('/posts', methods=['GET'])
 def get_posts():
-    """获取博客文章列表（分页）"""
+    """
+    获取博客文章列表
+    分页模式: ?page=&per_page=
+    游标模式: ?cursor=<created_at>,<id>&per_page=（首页传空 cursor），
+             返回 next_cursor；with_total=1 时附带总数（按指纹缓存），否则不执行 COUNT
+    筛选: ?tag=&category=，两种模式均可使用
+    """
     try:
         db, BlogPost = get_db_models()
+        from models_blog import Tag, post_tag
         
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        per_page = max(1, min(per_page, 100))
+        tag = request.args.get('tag', '').strip()
+        category = request.args.get('category', '').strip()
+        filters = (tag, category)
         
-        # 只返回已发布的文章
-        query = BlogPost.query.filter_by(is_published=True).order_by(BlogPost.created_at.desc())
+        # 只返回已发布的文章，排序命中 (is_published, created_at, id) 索引；
+        # 按分类筛选时命中 (category, is_published, created_at, id) 索引
+        query = BlogPost.query.filter_by(is_published=True)
+        if category:
+            query = query.filter(BlogPost.category == category)
+        if tag:
+            # 经 tag.name 唯一索引和 post_tag 主键/索引连接，每篇文章最多匹配一行
+            query = query.join(post_tag, post_tag.c.post_id == BlogPost.id)\
+                .join(Tag, Tag.id == post_tag.c.tag_id)\
+                .filter(Tag.name == tag)
+        query = query.order_by(BlogPost.created_at.desc(), BlogPost.id.desc())
         
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        if 'cursor' in request.args:
+            cursor = request.args.get('cursor', '')
+            with_total = request.args.get('with_total', 0, type=int) == 1
+            try:
+                position = parse_cursor(cursor) if cursor else None
+            except ValueError:
+                return jsonify({'error': '无效的游标'}), 400
+            # 缓存键使用解析后的游标，同一位置的不同写法共用一项
+            cursor_key = f'{position[0].isoformat()},{position[1]}' if position else ''
+            
+            def build_cursor_page(fingerprint):
+                page_query = query
+                if position:
+                    page_query = page_query.filter(
+                        db.tuple_(BlogPost.created_at, BlogPost.id) < position
+                    )
+                posts = page_query.limit(per_page + 1).all()
+                has_next = len(posts) > per_page
+                posts = posts[:per_page]
+                
+                from media_pipeline import attach_srcsets
+                data = {
+                    'posts': attach_srcsets([post.to_dict() for post in posts]),
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'next_cursor': f'{posts[-1].created_at.isoformat()},{posts[-1].id}' if has_next else None
+                }
+                if with_total:
+                    data['total'] = get_published_total(fingerprint, query, filters)
+                return data
+            
+            return cached_listing_response(('cursor', cursor_key, per_page, with_total) + filters, build_cursor_page)
         
-        return jsonify({
-            'posts': [post.to_dict() for post in pagination.items],
-            'total': pagination.total,
-            'page': page,
-            'per_page': per_page,
-            'pages': pagination.pages,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
-        })
+        page = max(1, request.args.get('page', 1, type=int))
+        
+        def build_page(fingerprint):
+            total = get_published_total(fingerprint, query, filters)
+            posts = query.offset((page - 1) * per_page).limit(per_page).all()
+            pages = (total + per_page - 1) // per_page
+            
+            from media_pipeline import attach_srcsets
+            return {
+                'posts': attach_srcsets([post.to_dict() for post in posts]),
+                'total': total,
+                'page': page,
+                'per_page': per_page,
+                'pages': pages,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+        
+        return cached_listing_response(('page', page, per_page) + filters, build_page)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @blog_bp.route('/posts/<int:post_id>', methods=['GET'])
 def get_post(post_id):
-    """获取单篇博客文章详情"""
+    """
+    获取单篇博客文章详情
+    Query参数: format=html 时返回服务端渲染的 content_html 而不是 Markdown 原文
+    """
     try:
         db, BlogPost = get_db_models()
+        from view_counter import view_counter
         post = BlogPost.query.get_or_404(post_id)
         
-        # 增加浏览量
-        post.view_count += 1
-        db.session.commit()
+        # 增加浏览量（内存累计，后台定期写入）
+        view_counter.hit(post_id)
         
-        return jsonify(post.to_dict(include_content=True))
+        if request.args.get('format') == 'html':
+            from blog_render import get_post_html
+            data = post.to_dict()
+            data['content_html'] = get_post_html(post)
+        else:
+            data = post.to_dict(include_content=True)
+        data['view_count'] = (data['view_count'] or 0) + view_counter.pending(post_id)
+        return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
+@blog_bp.route('/tags', methods=['GET'])
+def get_tags():
+    """获取有已发布文章的标签及文章数，按文章数降序"""
+    try:
+        from models_blog import Tag
+        
+        def build_tags(fingerprint):
+            tags = Tag.query.filter(Tag.post_count > 0)\
+                .order_by(Tag.post_count.desc(), Tag.name).all()
+            return {'tags': [tag.to_dict() for tag in tags]}
+        
+        return cached_listing_response(('tags',), build_tags)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@blog_bp.route('/categories', methods=['GET'])
+def get_categories():
+    """获取有已发布文章的分类及文章数，按名称排序"""
+    try:
+        from models_blog import Category
+        
+        def build_categories(fingerprint):
+            categories = Category.query.filter(Category.post_count > 0)\
+                .order_by(Category.name).all()
+            return {'categories': [category.to_dict() for category in categories]}
+        
+        return cached_listing_response(('categories',), build_categories)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@blog_bp.route('/search', methods=['GET'])
+def search():
+    """
+    全文搜索文章和项目
+    Query参数: q (关键词，空格分隔表示同时包含), type (all/posts/projects，默认all),
+              limit (默认10，最多50), offset
+    """
+    try:
+        db, BlogPost = get_db_models()
+        import search_index
+        
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({'error': '请输入搜索关键词'}), 400
+        if not search_index.is_enabled():
+            return jsonify({'error': '搜索功能不可用'}), 503
+        
+        search_type = request.args.get('type', 'all')
+        limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        
+        result = {'q': q, 'limit': limit, 'offset': offset}
+        
+        if search_type in ('all', 'posts'):
+            hits = search_index.search_posts(q, limit, offset)
+            posts = {
+                post.id: post for post in BlogPost.query
+                .options(db.defer(BlogPost.content))
+                .filter(BlogPost.id.in_([hit[0] for hit in hits]))
+            }
+            result['posts'] = [
+                dict(posts[post_id].to_dict(), snippet=snippet, score=score)
+                for post_id, snippet, score in hits if post_id in posts
+            ]
+        
+        if search_type in ('all', 'projects'):
+            from models_admin import Project
+            hits = search_index.search_projects(q, limit, offset)
+            projects = {
+                project.id: project for project in
+                Project.query.filter(Project.id.in_([hit[0] for hit in hits]))
+            }
+            result['projects'] = [
+                dict(projects[project_id].to_dict(), snippet=snippet, score=score)
+                for project_id, snippet, score in hits if project_id in projects
+            ]
+        
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 管理员接口
 
+# 管理列表可用的排序字段
+ADMIN_SORT_FIELDS = ('created_at', 'updated_at', 'title', 'view_count')
+
 @blog_bp.route('/admin/posts', methods=['GET'])
 @login_required
 def admin_get_posts():
-    """管理员获取所有文章（包括未发布的）"""
+    """
+    管理员分页获取文章列表（包括未发布的），不返回正文
+    Query参数: page, per_page (默认20，最多100),
+              sort (created_at/updated_at/title/view_count，默认created_at), order (asc/desc，默认desc),
+              status (published/draft), category, tag, q (标题包含)
+    正文通过 GET /admin/posts/<id> 单独获取
+    """
     try:
         db, BlogPost = get_db_models()
-        posts = BlogPost.query.order_by(BlogPost.created_at.desc()).all()
+        from models_blog import Tag, post_tag
+        
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+        sort = request.args.get('sort', 'created_at')
+        if sort not in ADMIN_SORT_FIELDS:
+            return jsonify({'error': f'sort 只能是 {", ".join(ADMIN_SORT_FIELDS)}'}), 400
+        order = request.args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'order 只能是 asc 或 desc'}), 400
+        
+        # 只加载列表需要的列，content 和 content_html 不会被读取
+        query = BlogPost.query.options(db.load_only(
+            BlogPost.id, BlogPost.title, BlogPost.category, BlogPost.summary,
+            BlogPost.thumbnail, BlogPost.author, BlogPost.tags, BlogPost.is_published,
+            BlogPost.view_count, BlogPost.created_at, BlogPost.updated_at
+        ))
+        
+        status = request.args.get('status')
+        if status == 'published':
+            query = query.filter(BlogPost.is_published == True)
+        elif status == 'draft':
+            query = query.filter(BlogPost.is_published == False)
+        
+        category = request.args.get('category', '').strip()
+        if category:
+            query = query.filter(BlogPost.category == category)
+        
+        tag = request.args.get('tag', '').strip()
+        if tag:
+            query = query.join(post_tag, post_tag.c.post_id == BlogPost.id)\
+                .join(Tag, Tag.id == post_tag.c.tag_id)\
+                .filter(Tag.name == tag)
+        
+        keyword = request.args.get('q', '').strip()
+        if keyword:
+            query = query.filter(BlogPost.title.contains(keyword, autoescape=True))
+        
+        total = query.order_by(None).count()
+        column = getattr(BlogPost, sort)
+        if order == 'desc':
+            query = query.order_by(column.desc(), BlogPost.id.desc())
+        else:
+            query = query.order_by(column.asc(), BlogPost.id.asc())
+        posts = query.offset((page - 1) * per_page).limit(per_page).all()
+        pages = (total + per_page - 1) // per_page
+        
         return jsonify({
-            'posts': [post.to_dict(include_content=True) for post in posts]
+            'posts': [post.to_dict() for post in posts],
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': pages,
+            'has_next': page < pages,
+            'has_prev': page > 1
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@blog_bp.route('/admin/posts/<int:post_id>', methods=['GET'])
+@login_required
+def admin_get_post(post_id):
+    """管理员获取单篇文章（含正文，用于编辑，不计浏览量）"""
+    try:
+        db, BlogPost = get_db_models()
+        post = BlogPost.query.get_or_404(post_id)
+        return jsonify(post.to_dict(include_content=True))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
 @blog_bp.route('/admin/posts', methods=['POST'])
 @login_required
 def create_post():
@@ -105,8 +425,21 @@ def create_post():
             is_published=data.get('is_published', True)
         )
         
+        from blog_render import refresh_post_html
+        refresh_post_html(post)
+        
         db.session.add(post)
+        db.session.flush()  # 获取文章ID
+        
+        from models_blog import sync_post_taxonomy, bump_listing_version
+        sync_post_taxonomy(post)
+        bump_listing_version()
+        
+        from search_index import index_post
+        index_post(post)
+        
         db.session.commit()
+        invalidate_listing_cache()
         
         return jsonify(post.to_dict(include_content=True)), 201
     except Exception as e:
@@ -122,6 +455,7 @@ def update_post(post_id):
         db, BlogPost = get_db_models()
         post = BlogPost.query.get_or_404(post_id)
         data = request.get_json()
+        old_category = post.category
         
         post.title = data.get('title', post.title)
         post.category = data.get('category', post.category)
@@ -133,7 +467,18 @@ def update_post(post_id):
         post.is_published = data.get('is_published', post.is_published)
         post.updated_at = datetime.utcnow()
         
+        from blog_render import refresh_post_html
+        refresh_post_html(post)
+        
+        from models_blog import sync_post_taxonomy, bump_listing_version
+        sync_post_taxonomy(post, old_category)
+        bump_listing_version()
+        
+        from search_index import index_post
+        index_post(post)
+        
         db.session.commit()
+        invalidate_listing_cache()
         
         return jsonify(post.to_dict(include_content=True))
     except Exception as e:
@@ -149,7 +494,17 @@ def delete_post(post_id):
         db, BlogPost = get_db_models()
         post = BlogPost.query.get_or_404(post_id)
         db.session.delete(post)
+        db.session.flush()
+        
+        from models_blog import remove_post_taxonomy, bump_listing_version
+        remove_post_taxonomy(post)
+        bump_listing_version()
+        
+        from search_index import remove_post
+        remove_post(post_id)
+        
         db.session.commit()
+        invalidate_listing_cache()
         
         return jsonify({'message': '删除成功'})
     except Exception as e:
@@ -171,21 +526,14 @@ def upload_image():
             return jsonify({'error': '没有选择文件'}), 400
         
         if file and allowed_file(file.filename):
-            # 生成唯一文件名
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(filename)
-            filename = f"{name}_{timestamp}{ext}"
-            
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(filepath)
-            
-            # 返回相对URL
-            url = f'/static/uploads/blog/{filename}'
+            # 按内容哈希命名，重复上传复用已有文件；缩放图和 WebP 由后台生成
+            from media_pipeline import save_upload
+            media = save_upload(file, UPLOAD_FOLDER, '/static/uploads/blog')
             
             return jsonify({
-                'url': url,
-                'filename': filename
+                'url': media.url,
+                'filename': os.path.basename(media.url),
+                'media': media.to_dict()
             })
         else:
             return jsonify({'error': '不支持的文件类型'}), 400
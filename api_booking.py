@@ -2,15 +2,71 @@
 421B 时间预约 API
 提供查询和创建预约的接口
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from database import db
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
+from sqlalchemy.exc import OperationalError
+from booking_intervals import load_intervals, format_minutes, parse_minutes
+from booking_engine import (
+    BookingConflict, reserve, reserve_series, cancel, cancel_series, is_lock_timeout,
+    date_versions, expand_dates, find_conflicts
+)
 
 booking_bp = Blueprint('booking', __name__, url_prefix='/api/booking')
 
+MAX_RANGE_DAYS = 62  # /free 和 /calendar 一次最多查询的天数
+BITMAP_BIN_MINUTES = (5, 10, 15, 30, 60)  # /calendar 位图模式可选的时间格大小
+MAX_SERIES_SPAN_DAYS = 366  # 周期预约最长跨度
+
+class BookingSeries(db.Model):
+    """
+    周期预约规则（类似 RRULE 的 DAILY/WEEKLY + UNTIL）
+    创建时展开为 booking 表中的各次预约（series_id 指向本规则），
+    规则本身只在查看时通过 occurrences() 按需展开
+    """
+    __tablename__ = 'booking_series'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    dept = db.Column(db.String(100))
+    freq = db.Column(db.String(10), nullable=False)  # daily/weekly
+    interval = db.Column(db.Integer, default=1, nullable=False)  # 每 interval 天/周
+    weekdays = db.Column(db.String(20))  # weekly: 逗号分隔的星期几，0=周一
+    start_date = db.Column(db.Date, nullable=False)
+    until = db.Column(db.Date, nullable=False)  # 最后一天（包含）
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def get_weekdays(self):
+        return [int(d) for d in self.weekdays.split(',')] if self.weekdays else []
+    
+    def occurrences(self):
+        """按规则逐个生成日期"""
+        return expand_dates(self.freq, self.interval, self.get_weekdays(), self.start_date, self.until)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'dept': self.dept,
+            'freq': self.freq,
+            'interval': self.interval,
+            'weekdays': self.get_weekdays(),
+            'start_date': self.start_date.isoformat(),
+            'until': self.until.isoformat(),
+            'start': self.start_time.strftime('%H:%M'),
+            'end': self.end_time.strftime('%H:%M'),
+            'created_at': self.created_at.isoformat()
+        }
+
 class Booking(db.Model):
     """预约记录"""
     __tablename__ = 'booking'
+    __table_args__ = (
+        # 按天查询、冲突检测和空闲时间计算都只需扫描该索引
+        db.Index('ix_booking_date_start_end', 'date', 'start_time', 'end_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)  # 预约人姓名
@@ -18,6 +74,7 @@ class Booking(db.Model):
     date = db.Column(db.Date, nullable=False)  # 预约日期
     start_time = db.Column(db.Time, nullable=False)  # 开始时间
     end_time = db.Column(db.Time, nullable=False)  # 结束时间
+    series_id = db.Column(db.Integer, db.ForeignKey('booking_series.id'), index=True)  # 所属周期预约
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     def to_dict(self):
@@ -28,9 +85,41 @@ class Booking(db.Model):
             'date': self.date.isoformat(),
             'start': self.start_time.strftime('%H:%M'),
             'end': self.end_time.strftime('%H:%M'),
+            'series_id': self.series_id,
             'created_at': self.created_at.isoformat()
         }
 
+class BookingDay(db.Model):
+    """每天一行：写入该天预约前先更新该行（按天串行化写入），version 为该天数据的版本号"""
+    __tablename__ = 'booking_day'
+    
+    date = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+def busy_response():
+    """等待写锁超时"""
+    return jsonify({'success': False, 'error': '预约繁忙，请稍后重试'}), 503
+
+def parse_date_range(from_str, to_str):
+    """
+    解析查询的日期范围，to 为空时等于 from
+    
+    Raises:
+        ValueError: 格式错误或范围无效，消息可直接返回给前端
+    """
+    if not from_str:
+        raise ValueError('缺少from参数')
+    try:
+        start_date = datetime.strptime(from_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(to_str or from_str, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('日期格式错误，应为YYYY-MM-DD')
+    if end_date < start_date:
+        raise ValueError('to 不能早于 from')
+    if (end_date - start_date).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'一次最多查询 {MAX_RANGE_DAYS} 天')
+    return start_date, end_date
+
 @booking_bp.route('/slots', methods=['GET'])
 def get_slots():
     """
@@ -67,6 +156,124 @@ def get_slots():
     except Exception as e:
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
+@booking_bp.route('/free', methods=['GET'])
+def get_free_windows():
+    """
+    获取日期范围内每天的空闲时间段
+    Query参数: from, to (YYYY-MM-DD，to 默认等于 from，最多62天),
+              min_minutes (最短时长，默认30), open/close (每天的可预约时间，默认 00:00/24:00)
+    返回: {from, to, min_minutes, days: [{date, free: [{start, end, minutes}]}]}
+    """
+    try:
+        try:
+            start_date, end_date = parse_date_range(
+                request.args.get('from') or request.args.get('date'), request.args.get('to')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            day_start = parse_minutes(request.args.get('open', '00:00'))
+            day_end = parse_minutes(request.args.get('close', '24:00'))
+        except ValueError:
+            return jsonify({'error': '时间格式错误，应为HH:MM'}), 400
+        
+        if day_start >= day_end:
+            return jsonify({'error': 'close 必须晚于 open'}), 400
+        
+        min_minutes = max(1, request.args.get('min_minutes', 30, type=int))
+        
+        days = []
+        for day, intervals in load_intervals(Booking, start_date, end_date).items():
+            days.append({
+                'date': day.isoformat(),
+                'free': [
+                    {'start': format_minutes(start), 'end': format_minutes(end), 'minutes': end - start}
+                    for start, end in intervals.free_windows(day_start, day_end, min_minutes)
+                ]
+            })
+        
+        return jsonify({
+            'from': start_date.isoformat(),
+            'to': end_date.isoformat(),
+            'min_minutes': min_minutes,
+            'days': days
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+@booking_bp.route('/calendar', methods=['GET'])
+def get_calendar():
+    """
+    一次获取日期范围内每天的预约情况
+    Query参数: from, to (YYYY-MM-DD，to 默认等于 from，最多62天),
+              format (slots/bitmap，默认slots), bin (位图每格分钟数: 5/10/15/30/60，默认15)
+    返回:
+      slots:  {from, to, format, days: [{date, slots: [{start, end, name, dept}]}]}
+      bitmap: {from, to, format, bin_minutes, days: [{date, bitmap}]}
+              bitmap 为十六进制字符串，第 0 格为最高位，占用为 1
+    支持 ETag 条件请求，范围内没有写入时返回 304
+    """
+    try:
+        try:
+            start_date, end_date = parse_date_range(request.args.get('from'), request.args.get('to'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        fmt = request.args.get('format', 'slots')
+        if fmt not in ('slots', 'bitmap'):
+            return jsonify({'error': 'format 只能是 slots 或 bitmap'}), 400
+        bin_minutes = request.args.get('bin', 15, type=int)
+        if fmt == 'bitmap' and bin_minutes not in BITMAP_BIN_MINUTES:
+            return jsonify({'error': f'bin 只能是 {"/".join(map(str, BITMAP_BIN_MINUTES))}'}), 400
+        
+        # 先读版本再读数据：两次读取之间有写入时 ETag 偏旧，下次请求会重新获取，不会缓存旧数据
+        version = date_versions(start_date, end_date)
+        etag = f'{start_date.isoformat()}-{end_date.isoformat()}-{fmt}-' + \
+            (f'{bin_minutes}-' if fmt == 'bitmap' else '') + str(version)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            result = {
+                'from': start_date.isoformat(),
+                'to': end_date.isoformat(),
+                'format': fmt
+            }
+            if fmt == 'bitmap':
+                result['bin_minutes'] = bin_minutes
+                result['days'] = [
+                    {'date': day.isoformat(), 'bitmap': intervals.bitmap(bin_minutes)}
+                    for day, intervals in load_intervals(Booking, start_date, end_date).items()
+                ]
+            else:
+                rows = db.session.query(
+                    Booking.date, Booking.start_time, Booking.end_time, Booking.name, Booking.dept
+                ).filter(Booking.date >= start_date, Booking.date <= end_date)\
+                    .order_by(Booking.date, Booking.start_time)\
+                    .all()
+                by_date = {}
+                for day, start, end, name, dept in rows:
+                    by_date.setdefault(day, []).append({
+                        'start': start.strftime('%H:%M'),
+                        'end': end.strftime('%H:%M'),
+                        'name': name,
+                        'dept': dept or ''
+                    })
+                result['days'] = [
+                    {'date': (start_date + timedelta(days=i)).isoformat(),
+                     'slots': by_date.get(start_date + timedelta(days=i), [])}
+                    for i in range((end_date - start_date).days + 1)
+                ]
+            response = jsonify(result)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
 @booking_bp.route('/reserve', methods=['POST'])
 def create_reservation():
     """
@@ -103,32 +310,19 @@ def create_reservation():
         if start_time >= end_time:
             return jsonify({'success': False, 'error': '结束时间必须晚于开始时间'}), 400
         
-        # 检查时间冲突（关键：确保没有重叠）
-        # 两个时间段重叠的条件：start1 < end2 AND start2 < end1
-        conflicting_bookings = Booking.query.filter(
-            Booking.date == booking_date,
-            Booking.start_time < end_time,
-            Booking.end_time > start_time
-        ).all()
-        
-        if conflicting_bookings:
-            conflict_info = conflicting_bookings[0]
+        # 检查时间冲突并创建（同一天的写入串行执行，不会重复预约）
+        try:
+            booking = reserve(name, dept, booking_date, start_time, end_time)
+        except BookingConflict as e:
             return jsonify({
                 'success': False,
-                'error': f'时间冲突：{conflict_info.start_time.strftime("%H:%M")}-{conflict_info.end_time.strftime("%H:%M")} 已被 {conflict_info.name} 预约'
+                'error': str(e),
+                'conflicts': e.conflicts
             }), 409
-        
-        # 创建预约
-        booking = Booking(
-            name=name,
-            dept=dept,
-            date=booking_date,
-            start_time=start_time,
-            end_time=end_time
-        )
-        
-        db.session.add(booking)
-        db.session.commit()
+        except OperationalError as e:
+            if not is_lock_timeout(e):
+                raise
+            return busy_response()
         
         return jsonify({
             'success': True,
@@ -142,26 +336,45 @@ def create_reservation():
 @booking_bp.route('/reservations', methods=['GET'])
 def list_reservations():
     """
-    获取所有预约列表（可选，用于管理）
-    可选Query参数: start_date, end_date
+    分页获取预约列表（可选，用于管理），按日期和开始时间倒序
+    可选Query参数: start_date, end_date, page, per_page (默认50，最多200)
+    返回: {reservations, total, page, per_page, pages, has_next, has_prev}
     """
     try:
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = max(1, min(request.args.get('per_page', 50, type=int), 200))
         
         query = Booking.query
         
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            query = query.filter(Booking.date >= start_date)
-        
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            query = query.filter(Booking.date <= end_date)
+        try:
+            if start_date_str:
+                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+                query = query.filter(Booking.date >= start_date)
+            
+            if end_date_str:
+                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+                query = query.filter(Booking.date <= end_date)
+        except ValueError:
+            return jsonify({'error': '日期格式错误，应为YYYY-MM-DD'}), 400
         
-        bookings = query.order_by(Booking.date.desc(), Booking.start_time.desc()).all()
+        total = query.count()
+        bookings = query.order_by(Booking.date.desc(), Booking.start_time.desc(), Booking.id.desc())\
+            .offset((page - 1) * per_page)\
+            .limit(per_page)\
+            .all()
+        pages = (total + per_page - 1) // per_page
         
-        return jsonify([b.to_dict() for b in bookings]), 200
+        return jsonify({
+            'reservations': [b.to_dict() for b in bookings],
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': pages,
+            'has_next': page < pages,
+            'has_prev': page > 1
+        }), 200
         
     except Exception as e:
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
@@ -172,15 +385,156 @@ def delete_reservation(booking_id):
     删除预约（可选，用于管理）
     """
     try:
-        booking = Booking.query.get(booking_id)
-        if not booking:
+        try:
+            deleted = cancel(booking_id)
+        except OperationalError as e:
+            if not is_lock_timeout(e):
+                raise
+            return busy_response()
+        if not deleted:
             return jsonify({'success': False, 'error': '预约不存在'}), 404
         
-        db.session.delete(booking)
-        db.session.commit()
-        
         return jsonify({'success': True}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': f'服务器错误: {str(e)}'}), 500
+
+@booking_bp.route('/series', methods=['POST'])
+def create_series():
+    """
+    创建周期预约，所有日期一次检查冲突、在一个事务中创建
+    请求体: {name, dept, freq:'daily'|'weekly', interval:1, weekdays:[0-6，0=周一，weekly 默认为开始日期那天],
+            start_date:'YYYY-MM-DD', until:'YYYY-MM-DD'（包含，最长366天）, start:'HH:MM', end:'HH:MM',
+            skip_conflicts:false（为 true 时跳过有冲突的日期）, dry_run:false（只检查不创建）}
+    返回: 201 {success, series, dates, skipped} 或 409 {success:false, error, conflicts:[所有冲突]}
+    """
+    try:
+        data = request.get_json() or {}
+        
+        name = (data.get('name') or '').strip()
+        dept = (data.get('dept') or '').strip()
+        freq = data.get('freq', 'weekly')
+        if not name:
+            return jsonify({'success': False, 'error': '请填写姓名'}), 400
+        if freq not in ('daily', 'weekly'):
+            return jsonify({'success': False, 'error': 'freq 只能是 daily 或 weekly'}), 400
+        
+        try:
+            start_date = datetime.strptime(data.get('start_date', ''), '%Y-%m-%d').date()
+            until = datetime.strptime(data.get('until', ''), '%Y-%m-%d').date()
+            start_time = datetime.strptime(data.get('start', ''), '%H:%M').time()
+            end_time = datetime.strptime(data.get('end', ''), '%H:%M').time()
+            interval = int(data.get('interval', 1))
+            weekdays = [int(d) for d in data.get('weekdays') or [start_date.weekday()]]
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'日期或时间格式错误: {str(e)}'}), 400
+        
+        if start_time >= end_time:
+            return jsonify({'success': False, 'error': '结束时间必须晚于开始时间'}), 400
+        if until < start_date:
+            return jsonify({'success': False, 'error': 'until 不能早于 start_date'}), 400
+        if (until - start_date).days >= MAX_SERIES_SPAN_DAYS:
+            return jsonify({'success': False, 'error': f'周期预约最长 {MAX_SERIES_SPAN_DAYS} 天'}), 400
+        if not 1 <= interval <= 52:
+            return jsonify({'success': False, 'error': 'interval 应在 1-52 之间'}), 400
+        if any(d < 0 or d > 6 for d in weekdays):
+            return jsonify({'success': False, 'error': 'weekdays 应为 0-6（0=周一）'}), 400
+        
+        series = BookingSeries(
+            name=name,
+            dept=dept,
+            freq=freq,
+            interval=interval,
+            weekdays=','.join(map(str, sorted(set(weekdays)))) if freq == 'weekly' else None,
+            start_date=start_date,
+            until=until,
+            start_time=start_time,
+            end_time=end_time
+        )
+        dates = list(series.occurrences())
+        if not dates:
+            return jsonify({'success': False, 'error': '该规则在日期范围内没有任何一次'}), 400
+        
+        if data.get('dry_run'):
+            return jsonify({
+                'success': True,
+                'dates': [day.isoformat() for day in dates],
+                'conflicts': find_conflicts(dates, start_time, end_time)
+            }), 200
+        
+        try:
+            created_dates, skipped = reserve_series(series, skip_conflicts=bool(data.get('skip_conflicts')))
+        except BookingConflict as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'conflicts': e.conflicts
+            }), 409
+        except OperationalError as e:
+            if not is_lock_timeout(e):
+                raise
+            return busy_response()
+        
+        return jsonify({
+            'success': True,
+            'series': series.to_dict(),
+            'dates': [day.isoformat() for day in created_dates],
+            'skipped': skipped
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'服务器错误: {str(e)}'}), 500
+
+@booking_bp.route('/series/<int:series_id>', methods=['GET'])
+def get_series(series_id):
+    """
+    获取周期预约规则，按规则展开各次日期
+    返回: {series, occurrences: [{date, booked}]}，单独删除过的日期 booked 为 false
+    """
+    try:
+        series = db.session.get(BookingSeries, series_id)
+        if not series:
+            return jsonify({'error': '周期预约不存在'}), 404
+        
+        booked = {day for (day,) in db.session.query(Booking.date).filter(Booking.series_id == series_id)}
+        return jsonify({
+            'series': series.to_dict(),
+            'occurrences': [
+                {'date': day.isoformat(), 'booked': day in booked}
+                for day in series.occurrences()
+            ]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+@booking_bp.route('/series/<int:series_id>', methods=['DELETE'])
+def delete_series(series_id):
+    """
+    删除周期预约
+    可选Query参数: from (YYYY-MM-DD，只删除该日期及之后的预约，规则截止到前一天)
+    """
+    try:
+        from_date = None
+        if request.args.get('from'):
+            try:
+                from_date = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'success': False, 'error': '日期格式错误，应为YYYY-MM-DD'}), 400
+        
+        try:
+            deleted = cancel_series(series_id, from_date)
+        except OperationalError as e:
+            if not is_lock_timeout(e):
+                raise
+            return busy_response()
+        if deleted is None:
+            return jsonify({'success': False, 'error': '周期预约不存在'}), 404
+        
+        return jsonify({'success': True, 'deleted': deleted}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'服务器错误: {str(e)}'}), 500
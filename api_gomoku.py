@@ -4,9 +4,31 @@
 from flask import Blueprint, jsonify, request
 from database import db
 from datetime import datetime
+from sqlalchemy.orm.exc import StaleDataError
+from gomoku_cache import room_cache, load_room_state
+import threading
 
 gomoku_bp = Blueprint('gomoku', __name__, url_prefix='/api/gomoku')
 
+# 长轮询超时，需小于 gunicorn.conf.py 中的 timeout
+LONG_POLL_TIMEOUT = 25  # 秒
+# 每个进程同时等待的长轮询请求上限，需小于 gunicorn.conf.py 中的 threads，
+# 留出线程处理走棋等其他请求；超出时立即返回，客户端按 Retry-After 稍后再查
+MAX_LONG_POLL_WAITERS = 24
+POLL_RETRY_AFTER = 2  # 秒
+
+_long_poll_slots = threading.BoundedSemaphore(MAX_LONG_POLL_WAITERS)
+
+# 走棋记录单页最大条数
+MAX_MOVES_PAGE = 500
+
+
+def stale_room_response(room_code):
+    """其他请求（可能在其他进程）已先一步修改了房间"""
+    db.session.rollback()
+    room_cache.invalidate(room_code.upper())
+    return jsonify({'error': '房间状态已变化，请刷新后重试'}), 409
+
 
 @gomoku_bp.route('/rooms', methods=['POST'])
 def create_room():
@@ -43,6 +65,7 @@ def create_room():
         )
         db.session.add(player)
         db.session.commit()
+        room_cache.store(load_room_state(room))
         
         return jsonify({
             'room_code': room.room_code,
@@ -102,7 +125,9 @@ def join_room(room_code):
             player_color='white'
         )
         db.session.add(player)
+        room.touch()
         db.session.commit()
+        room_cache.store(load_room_state(room))
         
         return jsonify({
             'room_code': room.room_code,
@@ -112,6 +137,8 @@ def join_room(room_code):
             'message': '成功加入房间'
         }), 200
         
+    except StaleDataError:
+        return stale_room_response(room_code)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -120,29 +147,69 @@ def join_room(room_code):
 @gomoku_bp.route('/rooms/<room_code>', methods=['GET'])
 def get_room(room_code):
     """获取房间信息"""
-    from models_gomoku import GomokuRoom, GomokuMove
-    
     try:
-        room = GomokuRoom.query.filter_by(room_code=room_code.upper()).first()
-        if not room:
+        state = room_cache.get(room_code.upper())
+        if not state:
             return jsonify({'error': '房间不存在'}), 404
         
-        # 获取最后一步棋
-        last_move = GomokuMove.query.filter_by(room_id=room.id)\
-            .order_by(GomokuMove.move_number.desc()).first()
+        return jsonify(state.to_dict(include_board=True)), 200
         
-        response = room.to_dict(include_board=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gomoku_bp.route('/rooms/<room_code>/updates', methods=['GET'])
+def get_room_updates(room_code):
+    """
+    长轮询房间更新
+    Query参数: since (客户端已知的版本号), after (客户端已有的最后一步序号，可选)
+    房间有变化时返回增量（新走棋、回合、状态），超时仍无变化返回 204
+    """
+    from models_gomoku import GomokuMove
+    
+    try:
+        room_code = room_code.upper()
+        since = request.args.get('since', 0, type=int)
+        after = request.args.get('after', type=int)
+        
+        if _long_poll_slots.acquire(blocking=False):
+            try:
+                state = room_cache.wait_for_change(room_code, since, LONG_POLL_TIMEOUT)
+            finally:
+                _long_poll_slots.release()
+            retry_after = None
+        else:
+            state = room_cache.get(room_code)
+            retry_after = POLL_RETRY_AFTER
         
-        if last_move:
-            response['last_move'] = {
-                'x': last_move.position_x,
-                'y': last_move.position_y,
-                'color': last_move.player_color
-            }
+        if state is None:
+            return jsonify({'error': '房间不存在'}), 404
+        if state.version <= since:
+            headers = {'Retry-After': str(retry_after)} if retry_after else {}
+            return '', 204, headers
+        
+        # 未指定 after 时只返回最后一步；客户端只缺最后一步时直接使用缓存
+        if after is None:
+            after = state.move_count - 1
+        if after >= state.move_count - 1:
+            last_move = state.last_move
+            moves = [last_move] if last_move and last_move['move_number'] > after else []
         else:
-            response['last_move'] = None
+            moves = [m.to_dict() for m in GomokuMove.query.filter(
+                GomokuMove.room_id == state.room_id,
+                GomokuMove.move_number > after,
+                GomokuMove.move_number <= state.move_count
+            ).order_by(GomokuMove.move_number).all()]
         
-        return jsonify(response), 200
+        return jsonify({
+            'version': state.version,
+            'status': state.status,
+            'current_turn': state.current_turn,
+            'winner': state.winner,
+            'move_count': state.move_count,
+            'moves': moves,
+            'players': state.players
+        }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -185,7 +252,9 @@ def ready_player(room_code):
             room.status = 'playing'
             game_started = True
         
+        room.touch()
         db.session.commit()
+        room_cache.store(load_room_state(room))
         
         return jsonify({
             'message': '准备状态已更新',
@@ -193,6 +262,8 @@ def ready_player(room_code):
             'game_started': game_started
         }), 200
         
+    except StaleDataError:
+        return stale_room_response(room_code)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -202,7 +273,7 @@ def ready_player(room_code):
 def make_move(room_code):
     """落子"""
     from models_gomoku import GomokuRoom, GomokuPlayer, GomokuMove
-    from gomoku_logic import check_winner, is_board_full, validate_move, get_next_color, color_to_value
+    from gomoku_logic import get_next_color, color_to_value
     
     try:
         data = request.get_json()
@@ -245,19 +316,20 @@ def make_move(room_code):
             return jsonify({'error': '还没轮到你下棋'}), 400
         
         # 获取棋盘
-        board = room.get_board()
+        board = room.load_board()
         
         # 验证落子
-        is_valid, error_msg = validate_move(board, x, y, room.board_size)
+        is_valid, error_msg = board.validate(x, y)
         if not is_valid:
             return jsonify({'error': error_msg}), 400
         
         # 落子
         color_value = color_to_value(player.player_color)
-        board[x][y] = color_value
+        board.place(x, y, color_value)
         
-        # 记录走棋
-        move_number = GomokuMove.query.filter_by(room_id=room.id).count() + 1
+        # 记录走棋（计数器与走棋记录同一事务提交）
+        room.move_count = (room.move_count or 0) + 1
+        move_number = room.move_count
         move = GomokuMove(
             room_id=room.id,
             player_name=player_name,
@@ -269,7 +341,7 @@ def make_move(room_code):
         db.session.add(move)
         
         # 检查胜负
-        is_win, winning_line = check_winner(board, x, y, color_value)
+        is_win, winning_line = board.check_five(x, y, color_value)
         game_over = False
         winner = None
         
@@ -278,7 +350,7 @@ def make_move(room_code):
             room.winner = player_name
             game_over = True
             winner = player_name
-        elif is_board_full(board):
+        elif board.is_full():
             room.status = 'finished'
             room.winner = 'draw'
             game_over = True
@@ -289,15 +361,16 @@ def make_move(room_code):
         
         # 更新棋盘
         room.set_board(board)
-        room.updated_at = datetime.utcnow()
+        room.touch()
         player.last_active = datetime.utcnow()
         
         db.session.commit()
+        room_cache.store(load_room_state(room, board, move))
         
         response = {
             'success': True,
             'move_number': move_number,
-            'board_state': board,
+            'board_state': board.to_list(),
             'current_turn': room.current_turn,
             'game_over': game_over,
             'winner': winner
@@ -308,6 +381,8 @@ def make_move(room_code):
         
         return jsonify(response), 200
         
+    except StaleDataError:
+        return stale_room_response(room_code)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -347,15 +422,18 @@ def surrender(room_code):
         # 结束游戏
         room.status = 'finished'
         room.winner = opponent.player_name if opponent else 'unknown'
-        room.updated_at = datetime.utcnow()
+        room.touch()
         
         db.session.commit()
+        room_cache.store(load_room_state(room))
         
         return jsonify({
             'message': '游戏结束',
             'winner': room.winner
         }), 200
         
+    except StaleDataError:
+        return stale_room_response(room_code)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -363,19 +441,57 @@ def surrender(room_code):
 
 @gomoku_bp.route('/rooms/<room_code>/moves', methods=['GET'])
 def get_moves(room_code):
-    """获取走棋记录"""
-    from models_gomoku import GomokuRoom, GomokuMove
+    """
+    获取走棋记录
+    Query参数: after (只返回序号大于 after 的走棋), limit (最多返回条数),
+              format=compact (返回 [[move_number, x, y, color], ...]，color 1=黑 2=白)
+    """
+    from models_gomoku import GomokuMove
+    from gomoku_logic import color_to_value
     
     try:
-        room = GomokuRoom.query.filter_by(room_code=room_code.upper()).first()
-        if not room:
+        state = room_cache.get(room_code.upper())
+        if not state:
             return jsonify({'error': '房间不存在'}), 404
         
-        moves = GomokuMove.query.filter_by(room_id=room.id)\
-            .order_by(GomokuMove.move_number).all()
+        after = request.args.get('after', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        compact = request.args.get('format') == 'compact'
+        
+        if limit is not None:
+            limit = max(1, min(limit, MAX_MOVES_PAGE))
+        
+        # 命中 (room_id, move_number) 复合索引
+        if compact:
+            query = db.session.query(
+                GomokuMove.move_number,
+                GomokuMove.position_x,
+                GomokuMove.position_y,
+                GomokuMove.player_color
+            )
+        else:
+            query = GomokuMove.query
+        query = query.filter(
+            GomokuMove.room_id == state.room_id,
+            GomokuMove.move_number > after
+        ).order_by(GomokuMove.move_number)
+        
+        # 多取一条用于判断是否还有更多
+        rows = query.limit(limit + 1).all() if limit is not None else query.all()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if has_more else rows
+        
+        if compact:
+            moves = [[n, x, y, color_to_value(c)] for n, x, y, c in rows]
+            next_after = rows[-1][0] if rows else after
+        else:
+            moves = [m.to_dict() for m in rows]
+            next_after = rows[-1].move_number if rows else after
         
         return jsonify({
-            'moves': [m.to_dict() for m in moves]
+            'moves': moves,
+            'has_more': has_more,
+            'next_after': next_after
         }), 200
         
     except Exception as e:
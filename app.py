@@ -1,15 +1,21 @@
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, jsonify, request
 from database import db
 from datetime import datetime
+from collections import OrderedDict
 import os
+import threading
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 
+# 静态文件：预压缩版本、哈希文件名长期缓存、条件请求和 Range
+from asset_server import asset_server
+asset_server.init_app(app)
+
 # 注册 /static 路径作为静态文件的别名
 @app.route('/static/<path:filename>')
 def serve_static(filename):
     """提供 /static/ 路径访问静态文件"""
-    return send_from_directory('static', filename)
+    return asset_server.send(filename)
 
 # 数据库配置
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -18,8 +24,13 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or \
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
 
+# SQLite 调优：WAL、busy_timeout 等连接参数和多 worker 的连接池配置
+from sqlite_tuning import sqlite_tuning, engine_options
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
 # 初始化数据库
 db.init_app(app)
+sqlite_tuning.init_app(app)
 
 # 数据模型
 class Visitor(db.Model):
@@ -27,7 +38,7 @@ class Visitor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     ip_address = db.Column(db.String(45), nullable=False)
     user_agent = db.Column(db.String(255))
-    visit_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    visit_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     page = db.Column(db.String(255), default='/')
     
     def to_dict(self):
@@ -45,7 +56,7 @@ class Message(db.Model):
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120))
     content = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     
     def to_dict(self):
         return {
@@ -58,11 +69,19 @@ class Message(db.Model):
 
 class BlogPost(db.Model):
     """博客文章"""
+    __table_args__ = (
+        db.Index('ix_blog_post_published_created', 'is_published', 'created_at', 'id'),
+        db.Index('ix_blog_post_category_published', 'category', 'is_published', 'created_at', 'id'),
+        db.Index('ix_blog_post_updated_at', 'updated_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     category = db.Column(db.String(100))  # 分类
     summary = db.Column(db.String(500))  # 摘要
     content = db.Column(db.Text, nullable=False)  # Markdown内容
+    content_hash = db.Column(db.String(64))  # content_html 对应的渲染器版本和内容的 sha256
+    content_html = db.deferred(db.Column(db.Text))  # 服务端渲染的 HTML，按需加载
     thumbnail = db.Column(db.String(255))  # 缩略图
     author = db.Column(db.String(100), default='江玮陶')
     tags = db.Column(db.String(255))  # 标签，逗号分隔
@@ -89,40 +108,64 @@ class BlogPost(db.Model):
             data['content'] = self.content
         return data
 
+# 博客标签和分类索引表
+from models_blog import Tag, Category
+
+# 上传文件记录
+import models_media
+
+# 访客统计汇总表
+from models_visitor import add_visits_to_rollups, count_visits
+
 # 创建数据库表
 with app.app_context():
     db.create_all()
 
+# 全文搜索索引
+from search_index import init_search_index
+with app.app_context():
+    init_search_index()
+
+# 访客记录异步批量写入，同时累加汇总表
+from visitor_recorder import visitor_recorder
+visitor_recorder.init_app(app, Visitor.__table__, on_flush=add_visits_to_rollups)
+
+# 博客浏览量异步累加
+from view_counter import view_counter
+view_counter.init_app(app, BlogPost.__table__)
+
 @app.route('/')
 def index():
     """返回首页"""
-    # 记录访客
+    # 记录访客（放入队列，由后台线程批量写入）
     try:
-        visitor = Visitor(
+        visitor_recorder.record(
             ip_address=request.remote_addr,
             user_agent=request.headers.get('User-Agent'),
             page='/'
         )
-        db.session.add(visitor)
-        db.session.commit()
     except Exception as e:
         print(f"记录访客失败: {e}")
     
-    return send_from_directory('static', 'index.html')
+    return asset_server.send('index.html')
 
 @app.route('/health')
 def health():
     """健康检查接口"""
+    sqlite_settings = None
     try:
         # 检查数据库连接
         db.session.execute(db.text('SELECT 1'))
         db_status = 'ok'
+        sqlite_settings = sqlite_tuning.stats(db.session.connection())
     except Exception as e:
         db_status = f'error: {str(e)}'
     
     return {
         'status': 'ok',
         'database': db_status,
+        'sqlite': sqlite_settings,
+        'visitor_queue': visitor_recorder.stats(),
         'timestamp': datetime.utcnow().isoformat()
     }, 200
 
@@ -130,8 +173,9 @@ def health():
 def get_visitors():
     """获取访客统计"""
     try:
-        total = Visitor.query.count()
-        recent = Visitor.query.order_by(Visitor.visit_time.desc()).limit(10).all()
+        total = count_visits()
+        # id 随写入时间递增，按主键倒序避免扫描 visit_time
+        recent = Visitor.query.order_by(Visitor.id.desc()).limit(10).all()
         
         return jsonify({
             'total': total,
@@ -140,9 +184,22 @@ def get_visitors():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 留言分页缓存（LRU）: (最新留言id, before_id, limit) -> 序列化后的响应体
+# 留言只增不改，最新留言 id 不变时缓存一直有效；多进程下各自通过 MAX(id) 发现新留言
+# before_id/limit 来自查询参数，限制条数避免被任意参数撑大
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+MESSAGES_CACHE_SIZE = 64
+_message_pages = OrderedDict()
+_message_pages_lock = threading.Lock()
+
 @app.route('/api/messages', methods=['GET', 'POST'])
 def messages():
-    """留言板接口"""
+    """
+    留言板接口
+    GET Query参数: before_id (只返回 id 更早的留言), limit (每页条数，默认50)
+    响应头 X-Next-Before-Id 给出下一页的 before_id
+    """
     if request.method == 'POST':
         try:
             data = request.get_json()
@@ -154,13 +211,57 @@ def messages():
             db.session.add(message)
             db.session.commit()
             
+            with _message_pages_lock:
+                _message_pages.clear()
+            
             return jsonify(message.to_dict()), 201
         except Exception as e:
             return jsonify({'error': str(e)}), 400
     else:
         try:
-            messages = Message.query.order_by(Message.created_at.desc()).all()
-            return jsonify([m.to_dict() for m in messages])
+            before_id = request.args.get('before_id', type=int)
+            limit = request.args.get('limit', MESSAGES_PAGE_SIZE, type=int)
+            limit = max(1, min(limit, MESSAGES_MAX_PAGE_SIZE))
+            
+            latest_id = db.session.query(db.func.max(Message.id)).scalar() or 0
+            etag = f'{latest_id}-{before_id or 0}-{limit}'
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            
+            key = (latest_id, before_id, limit)
+            with _message_pages_lock:
+                cached = _message_pages.get(key)
+                if cached is not None:
+                    _message_pages.move_to_end(key)
+            
+            if cached is None:
+                query = Message.query
+                if before_id is not None:
+                    cursor = db.session.get(Message, before_id)
+                    if cursor is None:
+                        query = query.filter(Message.id < before_id)
+                    else:
+                        query = query.filter(
+                            db.tuple_(Message.created_at, Message.id) < (cursor.created_at, cursor.id)
+                        )
+                page = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+                next_before_id = page[-1].id if len(page) == limit else None
+                cached = (app.json.dumps([m.to_dict() for m in page]), next_before_id)
+                with _message_pages_lock:
+                    if any(k[0] != latest_id for k in _message_pages):
+                        _message_pages.clear()
+                    _message_pages[key] = cached
+                    while len(_message_pages) > MESSAGES_CACHE_SIZE:
+                        _message_pages.popitem(last=False)
+            
+            body, next_before_id = cached
+            response = app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            if next_before_id is not None:
+                response.headers['X-Next-Before-Id'] = str(next_before_id)
+            return response
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
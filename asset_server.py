@@ -0,0 +1,114 @@
+"""
+静态文件服务
+- 优先使用 scripts/build_assets.py 生成的预压缩文件（按 Accept-Encoding 选择 br/gzip）
+- 文件名带内容哈希的资源和按内容哈希命名的上传文件返回 Cache-Control: immutable
+- 条件请求（ETag/Last-Modified）和 Range 请求由 send_file 处理
+未执行构建时直接返回 static/ 下的原文件
+"""
+from flask import request, abort, send_file
+from werkzeug.security import safe_join
+import json
+import mimetypes
+import os
+import re
+
+BUILD_DIR = 'static_build'
+MANIFEST_NAME = 'manifest.json'
+
+# 可压缩的文件类型
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt', '.xml', '.md', '.map', '.ico'}
+# 预压缩变体，按优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+PAGE_CACHE = 'no-cache'  # HTML 每次用 ETag 验证，保证能引用到新的哈希资源
+DEFAULT_CACHE = 'public, max-age=3600'
+
+# media_pipeline 生成的上传文件名：sha256 前16位，可带 -<宽度>w
+_HASHED_UPLOAD = re.compile(r'^uploads/(?:.+/)?[0-9a-f]{16}(?:-\d+w)?\.\w+$')
+
+
+class AssetServer:
+    """静态文件服务，替换 Flask 内置的 static 路由"""
+
+    def __init__(self):
+        self.static_dir = None
+        self.build_dir = None
+        self.assets = {}  # 原路径 -> 带哈希的路径
+        self.hashed = set()
+        self.pages = set()  # 构建目录中改写过资源引用的 HTML
+        self._manifest_mtime = None
+
+    def init_app(self, app, build_dir=BUILD_DIR):
+        self.static_dir = app.static_folder
+        self.build_dir = os.path.join(app.root_path, build_dir)
+        self._load_manifest()
+        app.view_functions['static'] = self.send
+
+    def _load_manifest(self):
+        path = os.path.join(self.build_dir, MANIFEST_NAME)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime == self._manifest_mtime:
+            return
+        self._manifest_mtime = mtime
+
+        manifest = {}
+        if mtime is not None:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        self.assets = manifest.get('assets', {})
+        self.hashed = set(self.assets.values())
+        self.pages = set(manifest.get('pages', []))
+
+    def send(self, filename):
+        """返回 static 下的文件，filename 为相对 static 的路径"""
+        # 重新构建后无需重启即可生效
+        self._load_manifest()
+
+        filename = filename.lstrip('/')
+        path = None
+        if filename in self.hashed:
+            path = safe_join(self.build_dir, filename)
+        elif filename in self.pages:
+            built = safe_join(self.build_dir, filename)
+            source = safe_join(self.static_dir, filename)
+            # 源文件在构建后被修改过时使用源文件
+            if built and source and os.path.isfile(built) and os.path.isfile(source) \
+                    and os.path.getmtime(built) >= os.path.getmtime(source):
+                path = built
+        if path is None:
+            path = safe_join(self.static_dir, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        compressible = os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+        # Range 请求按原文件处理，避免对压缩后的字节做分段
+        encoding = None
+        if compressible and 'Range' not in request.headers:
+            for name, suffix in ENCODINGS:
+                if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                    encoding = name
+                    path += suffix
+                    break
+
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if compressible:
+            response.vary.add('Accept-Encoding')
+
+        if filename in self.hashed or _HASHED_UPLOAD.match(filename):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE
+        elif mimetype == 'text/html':
+            response.headers['Cache-Control'] = PAGE_CACHE
+        else:
+            response.headers['Cache-Control'] = DEFAULT_CACHE
+        return response
+
+
+asset_server = AssetServer()
@@ -0,0 +1,115 @@
+"""
+博客 Markdown 服务端渲染
+每个内容版本（按内容哈希区分）只渲染一次，结果保存在 blog_post.content_html
+"""
+from collections import OrderedDict
+import hashlib
+import html
+import re
+import threading
+
+from markdown_it import MarkdownIt
+from mdit_py_plugins.tasklists import tasklists_plugin
+
+# 对应 blog_viewer.html 中 marked 的配置（gfm: true, breaks: true）：
+# CommonMark + GFM 表格、删除线、网址自动链接、任务列表，换行即 <br>，允许原始 HTML；
+# marked 11 不再生成标题 id，这里也不生成
+RENDERER_VERSION = 'markdown-it-gfm-1'  # 渲染规则变化时修改，已保存的 HTML 随之失效
+
+# 未持久化的渲染结果（如直接修改数据库后）按内容哈希缓存在内存中
+HTML_CACHE_SIZE = 128
+
+_MATH_BLOCK = re.compile(r'\$\$([\s\S]+?)\$\$')
+_MATH_INLINE = re.compile(r'\$([^\$\n]+?)\$')
+
+_html_cache = OrderedDict()
+_html_cache_lock = threading.Lock()
+
+
+def _strikethrough_as_del(state):
+    # marked 的删除线输出 <del>，markdown-it 默认为 <s>
+    for token in state.tokens:
+        for child in token.children or ():
+            if child.type in ('s_open', 's_close'):
+                child.tag = 'del'
+
+
+_markdown = MarkdownIt('gfm-like', {'breaks': True, 'html': True, 'linkify': True})\
+    .use(tasklists_plugin)
+_markdown.core.ruler.push('strikethrough_as_del', _strikethrough_as_del)
+
+
+def content_hash(content):
+    """内容哈希（sha256 十六进制），包含渲染器版本"""
+    return hashlib.sha256(f'{RENDERER_VERSION}\n{content or ""}'.encode('utf-8')).hexdigest()
+
+
+def render_markdown(content):
+    """
+    渲染 Markdown 为 HTML
+
+    数学公式先替换为占位符，渲染后还原为 math-block/math-inline，
+    由前端 KaTeX 处理，与 blog_viewer.html 的客户端渲染结果一致
+    """
+    math_blocks = []
+    math_inlines = []
+
+    def protect_block(match):
+        math_blocks.append(match.group(1))
+        return f'MATHBLOCK{len(math_blocks) - 1}MATHBLOCK'
+
+    def protect_inline(match):
+        math_inlines.append(match.group(1))
+        return f'MATHINLINE{len(math_inlines) - 1}MATHINLINE'
+
+    text = _MATH_BLOCK.sub(protect_block, content or '')
+    text = _MATH_INLINE.sub(protect_inline, text)
+
+    result = _markdown.render(text)
+
+    result = re.sub(
+        r'MATHBLOCK(\d+)MATHBLOCK',
+        lambda m: f'<span class="math-block">$${html.escape(math_blocks[int(m.group(1))])}$$</span>',
+        result
+    )
+    result = re.sub(
+        r'MATHINLINE(\d+)MATHINLINE',
+        lambda m: f'<span class="math-inline">${html.escape(math_inlines[int(m.group(1))])}$</span>',
+        result
+    )
+    return result
+
+
+def refresh_post_html(post):
+    """
+    内容有变化时重新渲染并写入 post.content_html（由调用方提交）
+
+    Returns:
+        是否重新渲染
+    """
+    digest = content_hash(post.content)
+    if post.content_hash == digest and post.content_html is not None:
+        return False
+    post.content_html = render_markdown(post.content)
+    post.content_hash = digest
+    return True
+
+
+def get_post_html(post):
+    """获取文章 HTML；已保存的结果过期时在内存中渲染，不写数据库"""
+    digest = content_hash(post.content)
+    if post.content_hash == digest and post.content_html is not None:
+        return post.content_html
+
+    with _html_cache_lock:
+        cached = _html_cache.get(digest)
+        if cached is not None:
+            _html_cache.move_to_end(digest)
+            return cached
+
+    rendered = render_markdown(post.content)
+    with _html_cache_lock:
+        _html_cache[digest] = rendered
+        while len(_html_cache) > HTML_CACHE_SIZE:
+            _html_cache.popitem(last=False)
+    return rendered
@@ -0,0 +1,271 @@
+"""
+预约写入
+写入某天的预约前先更新 booking_day 中该天的行，再检查冲突、插入：
+SQLite 上事务的第一条写语句即获得数据库写锁，其他写事务要等该事务提交后才能继续，
+因此冲突检查读到的一定是最新数据；PostgreSQL 上 ON CONFLICT DO UPDATE 持有该行的行锁到提交，
+同样按天串行。其他数据库不支持（lock_dates 抛出 NotImplementedError）。
+booking_day.version 同时作为该天预约数据的版本号
+"""
+from database import db, upsert_insert
+from datetime import timedelta
+from booking_intervals import load_intervals, to_minutes
+
+# SQLite 主错误码（扩展错误码的低 8 位）：写锁被占用 / 表被锁定
+_SQLITE_LOCK_ERRORS = (5, 6)  # SQLITE_BUSY, SQLITE_LOCKED
+# PostgreSQL: lock_not_available（lock_timeout）, deadlock_detected
+_POSTGRES_LOCK_ERRORS = ('55P03', '40P01')
+
+
+class BookingConflict(Exception):
+    """时间段已被预约"""
+
+    def __init__(self, conflicts, with_date=False):
+        """
+        Args:
+            conflicts: 冲突预约的 to_dict() 列表
+            with_date: 消息中包含日期（周期预约跨越多天，只有一处冲突时也需要日期）
+        """
+        self.conflicts = conflicts
+        first = conflicts[0]
+        when = f"{first['date']} " if with_date or len(conflicts) > 1 else ''
+        message = f"时间冲突：{when}{first['start']}-{first['end']} 已被 {first['name']} 预约"
+        if len(conflicts) > 1:
+            message += f"等 {len(conflicts)} 处"
+        super().__init__(message)
+
+
+def is_lock_timeout(error):
+    """OperationalError 是否为等待写锁超时（按驱动的错误码判断）"""
+    orig = getattr(error, 'orig', error)
+    code = getattr(orig, 'sqlite_errorcode', None)  # Python 3.11+
+    if code is not None:
+        return code & 0xff in _SQLITE_LOCK_ERRORS
+    pgcode = getattr(orig, 'pgcode', None)
+    if pgcode is not None:
+        return pgcode in _POSTGRES_LOCK_ERRORS
+    # 更早的 Python 没有 sqlite_errorcode，按 SQLite 的固定错误信息判断
+    return str(orig) in ('database is locked', 'database table is locked')
+
+
+def lock_dates(dates):
+    """
+    锁定这些日期并递增其版本号
+
+    必须是事务中的第一条语句：之前有读操作时，WAL 模式下旧快照无法升级为写事务
+    """
+    from api_booking import BookingDay
+
+    table = BookingDay.__table__
+    stmt = upsert_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['date'],
+        set_={'version': table.c.version + 1}
+    )
+    # 按日期顺序加锁，避免多个日期时互相等待
+    db.session.execute(stmt, [{'date': day, 'version': 1} for day in sorted(set(dates))])
+
+
+def date_versions(start_date, end_date):
+    """
+    日期范围内各天版本号之和
+    每次写入都会使该天版本号加 1（新行为 1），所以范围内有任何写入时该值一定变大，可用作 ETag
+    """
+    from api_booking import BookingDay
+
+    return db.session.query(db.func.coalesce(db.func.sum(BookingDay.version), 0))\
+        .filter(BookingDay.date >= start_date, BookingDay.date <= end_date)\
+        .scalar()
+
+
+def expand_dates(freq, interval, weekdays, start_date, until):
+    """
+    按规则逐个生成日期（生成器）
+
+    Args:
+        freq: 'daily' 每 interval 天一次；'weekly' 每 interval 周的 weekdays（0=周一）各一次
+        start_date, until: 日期范围（都包含）
+    """
+    if freq == 'daily':
+        day = start_date
+        while day <= until:
+            yield day
+            day += timedelta(days=interval)
+        return
+
+    week = start_date - timedelta(days=start_date.weekday())
+    offsets = sorted(set(weekdays))
+    while week <= until:
+        for offset in offsets:
+            day = week + timedelta(days=offset)
+            if day > until:
+                return
+            if day >= start_date:
+                yield day
+        week += timedelta(weeks=interval)
+
+
+def find_conflicts(dates, start_time, end_time):
+    """
+    一次查询找出这些日期中与 [start_time, end_time) 重叠的所有预约
+
+    Returns:
+        冲突预约的 to_dict() 列表，按日期和开始时间排序
+    """
+    from api_booking import Booking
+
+    if not dates:
+        return []
+    bookings = Booking.query.filter(
+        Booking.date.in_(sorted(set(dates))),
+        Booking.start_time < end_time,
+        Booking.end_time > start_time
+    ).order_by(Booking.date, Booking.start_time).all()
+    return [booking.to_dict() for booking in bookings]
+
+
+def reserve_series(series, skip_conflicts=False):
+    """
+    创建周期预约：锁定所有日期，一次检查冲突，在同一个事务中插入全部预约（由本函数提交）
+
+    Args:
+        series: 未保存的 BookingSeries
+        skip_conflicts: 为 True 时跳过有冲突的日期，只创建其余的预约
+
+    Returns:
+        (created_dates, conflicts)
+    Raises:
+        BookingConflict: 有冲突且 skip_conflicts 为 False，或所有日期都有冲突
+        sqlalchemy.exc.OperationalError: 等待写锁超时
+    """
+    from api_booking import Booking
+
+    dates = list(series.occurrences())
+    try:
+        lock_dates(dates)
+
+        conflicts = find_conflicts(dates, series.start_time, series.end_time)
+        if conflicts and not skip_conflicts:
+            raise BookingConflict(conflicts, with_date=True)
+        taken = {conflict['date'] for conflict in conflicts}
+        created_dates = [day for day in dates if day.isoformat() not in taken]
+        if not created_dates:
+            raise BookingConflict(conflicts, with_date=True)
+
+        db.session.add(series)
+        db.session.flush()
+        db.session.execute(db.insert(Booking), [
+            {
+                'name': series.name,
+                'dept': series.dept,
+                'date': day,
+                'start_time': series.start_time,
+                'end_time': series.end_time,
+                'series_id': series.id
+            }
+            for day in created_dates
+        ])
+        db.session.commit()
+        return created_dates, conflicts
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def cancel_series(series_id, from_date=None):
+    """
+    删除周期预约（由本函数提交）
+
+    Args:
+        from_date: 只删除该日期及之后的预约，规则截止到前一天；为 None 时删除全部预约和规则
+
+    Returns:
+        删除的预约数，规则不存在时返回 None
+    """
+    from api_booking import Booking, BookingSeries
+
+    query = db.session.query(Booking.date).filter(Booking.series_id == series_id)
+    if from_date is not None:
+        query = query.filter(Booking.date >= from_date)
+    exists = db.session.get(BookingSeries, series_id) is not None
+    dates = [day for (day,) in query.distinct()]
+    # 结束读事务，让加锁成为写事务的第一条语句
+    db.session.rollback()
+    if not exists:
+        return None
+
+    try:
+        if dates:
+            lock_dates(dates)
+        bookings = Booking.query.filter(Booking.series_id == series_id)
+        if from_date is not None:
+            bookings = bookings.filter(Booking.date >= from_date)
+        deleted = bookings.delete(synchronize_session=False)
+
+        series = db.session.get(BookingSeries, series_id)
+        if from_date is not None and from_date > series.start_date:
+            series.until = min(series.until, from_date - timedelta(days=1))
+        else:
+            db.session.delete(series)
+        db.session.commit()
+        return deleted
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def reserve(name, dept, booking_date, start_time, end_time):
+    """
+    创建预约（由本函数提交）
+
+    Raises:
+        BookingConflict: 与已有预约重叠
+        sqlalchemy.exc.OperationalError: 等待写锁超时
+    """
+    from api_booking import Booking
+
+    try:
+        lock_dates([booking_date])
+
+        day = load_intervals(Booking, booking_date, booking_date)[booking_date]
+        conflict_id = day.conflict(to_minutes(start_time), to_minutes(end_time))
+        if conflict_id is not None:
+            raise BookingConflict([db.session.get(Booking, conflict_id).to_dict()])
+
+        booking = Booking(
+            name=name,
+            dept=dept,
+            date=booking_date,
+            start_time=start_time,
+            end_time=end_time
+        )
+        db.session.add(booking)
+        db.session.commit()
+        return booking
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def cancel(booking_id):
+    """
+    删除预约（由本函数提交）
+
+    Returns:
+        是否删除（预约不存在时返回 False）
+    """
+    from api_booking import Booking
+
+    booking_date = db.session.query(Booking.date).filter_by(id=booking_id).scalar()
+    # 结束读事务，让加锁成为写事务的第一条语句
+    db.session.rollback()
+    if booking_date is None:
+        return False
+
+    try:
+        lock_dates([booking_date])
+        deleted = Booking.query.filter_by(id=booking_id).delete()
+        db.session.commit()
+        return deleted > 0
+    except Exception:
+        db.session.rollback()
+        raise
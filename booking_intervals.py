@@ -0,0 +1,130 @@
+"""
+预约时间区间索引
+同一天的预约按开始时间排序，并记录结束时间的前缀最大值（单调不减），
+冲突检测和空闲时间计算都可以用二分查找完成；
+修复前的并发写入可能留下互相重叠的预约，前缀最大值保证这种数据下结果仍然正确
+"""
+from bisect import bisect_right
+from datetime import timedelta
+
+DAY_MINUTES = 24 * 60
+
+
+def to_minutes(value):
+    """time -> 当天的分钟数"""
+    return value.hour * 60 + value.minute
+
+
+def format_minutes(minutes):
+    """分钟数 -> 'HH:MM'，一天结束表示为 '24:00'"""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def parse_minutes(value):
+    """
+    'HH:MM' -> 分钟数，允许 '24:00'
+
+    Raises:
+        ValueError: 格式错误
+    """
+    hour, _, minute = value.partition(':')
+    if not (hour.isdigit() and minute.isdigit() and len(minute) == 2):
+        raise ValueError(f'时间格式错误: {value}')
+    minutes = int(hour) * 60 + int(minute)
+    if int(minute) >= 60 or minutes > DAY_MINUTES:
+        raise ValueError(f'时间格式错误: {value}')
+    return minutes
+
+
+class DayIntervals:
+    """一天内已占用的时间段，starts 为升序的分钟数数组，max_ends[i] 为 ends[:i + 1] 的最大值"""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        self.max_ends = []
+        self.ids = []
+        for start, end, booking_id in sorted(intervals):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.max_ends.append(max(end, self.max_ends[-1]) if self.max_ends else end)
+            self.ids.append(booking_id)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def conflict(self, start, end):
+        """
+        返回与 [start, end) 重叠的第一个预约 id，没有重叠时返回 None
+
+        第一个 max_ends > start 的位置 i 上 ends[i] > start，且之前的区间都在 start 之前结束；
+        之后的区间开始得更晚，所以只需检查区间 i
+        """
+        i = bisect_right(self.max_ends, start)
+        if i < len(self.starts) and self.starts[i] < end:
+            return self.ids[i]
+        return None
+
+    def free_windows(self, day_start=0, day_end=DAY_MINUTES, min_minutes=1):
+        """
+        返回 [day_start, day_end) 内长度不少于 min_minutes 的空闲时间段
+
+        Returns:
+            [(start, end), ...]
+        """
+        windows = []
+        cursor = day_start
+        i = bisect_right(self.max_ends, day_start)
+        while cursor < day_end:
+            if i < len(self.starts) and self.starts[i] < day_end:
+                gap_end = self.starts[i]
+                next_cursor = self.ends[i]
+                i += 1
+            else:
+                gap_end = day_end
+                next_cursor = day_end
+            if gap_end - cursor >= min_minutes:
+                windows.append((cursor, gap_end))
+            cursor = max(cursor, next_cursor)
+        return windows
+
+    def bitmap(self, bin_minutes=15):
+        """
+        按 bin_minutes 分格的占用位图（十六进制字符串）
+        第 i 格与任一预约重叠时该位为 1，第 0 格为最高位；
+        bin_minutes 整除一天且格数为 4 的倍数时每个字符恰好对应 4 格
+        """
+        bins = DAY_MINUTES // bin_minutes
+        mask = 0
+        for start, end in zip(self.starts, self.ends):
+            first = start // bin_minutes
+            last = (end - 1) // bin_minutes
+            mask |= ((1 << (last - first + 1)) - 1) << (bins - 1 - last)
+        return f'{mask:0{(bins + 3) // 4}x}'
+
+
+def load_intervals(model, start_date, end_date):
+    """
+    查询日期范围内的预约并按天构建区间索引
+    只读取 (date, start_time, end_time) 索引中的列（id 为 rowid，同样在索引中）
+
+    Returns:
+        {date: DayIntervals}，范围内每天都有一项
+    """
+    from database import db
+
+    rows = db.session.query(model.date, model.start_time, model.end_time, model.id)\
+        .filter(model.date >= start_date, model.date <= end_date)\
+        .order_by(model.date, model.start_time)\
+        .all()
+
+    by_date = {}
+    for day, start, end, booking_id in rows:
+        by_date.setdefault(day, []).append((to_minutes(start), to_minutes(end), booking_id))
+
+    result = {}
+    day = start_date
+    while day <= end_date:
+        result[day] = DayIntervals(by_date.get(day, ()))
+        day += timedelta(days=1)
+    return result
@@ -0,0 +1,240 @@
+"""
+分块上传
+大文件分成若干块分别上传，每块单独校验，断线后可查询已收到的分块继续上传，
+全部收到后按块顺序拼接写入上传目录。分块保存在磁盘上，多个 worker 进程共享
+拼接前用条件更新把会话从 uploading 改为 completing，同一上传只会被拼接一次
+"""
+from database import db
+from datetime import datetime, timedelta
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+CHUNK_DIR = 'upload_chunks'  # 不在 static 下，未完成的分块不会被公开访问
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+SESSION_TTL = timedelta(hours=24)  # 超过该时间未完成的上传会被清理
+COPY_BUFFER = 1024 * 1024  # 读写缓冲区大小，内存占用与文件大小无关
+
+UPLOADING = 'uploading'
+COMPLETING = 'completing'
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadInProgress(Exception):
+    """上传正在拼接（另一个 complete 请求已开始），不能再修改"""
+
+
+def _session_dir(session_id):
+    return os.path.join(CHUNK_DIR, session_id)
+
+
+def _chunk_path(session_id, index):
+    return os.path.join(_session_dir(session_id), f'{index:06d}')
+
+
+def _check_sha256(value, name):
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if not _SHA256.match(value):
+        raise ValueError(f'{name} 必须是 64 位十六进制 sha256')
+    return value
+
+
+def create_session(filename, size, chunk_size=None, sha256=None):
+    """
+    创建上传会话（由本函数提交）
+
+    Raises:
+        ValueError: 参数不合法
+    """
+    from models_media import UploadSession
+
+    if not isinstance(size, int) or size <= 0:
+        raise ValueError('size 必须是正整数')
+    if size > MAX_UPLOAD_SIZE:
+        raise ValueError(f'文件不能超过 {MAX_UPLOAD_SIZE // 1024 // 1024}MB')
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if not isinstance(chunk_size, int) or not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f'chunk_size 必须在 {MIN_CHUNK_SIZE} 到 {MAX_CHUNK_SIZE} 字节之间')
+
+    cleanup_expired()
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        filename=filename[:255],
+        size=size,
+        chunk_size=chunk_size,
+        total_chunks=(size + chunk_size - 1) // chunk_size,
+        sha256=_check_sha256(sha256, 'sha256'),
+        status=UPLOADING
+    )
+    os.makedirs(_session_dir(session.id), exist_ok=True)
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def expected_length(session, index):
+    """第 index 块应有的字节数"""
+    return min(session.chunk_size, session.size - index * session.chunk_size)
+
+
+def received_chunks(session):
+    """已收到的分块序号（升序）"""
+    try:
+        names = os.listdir(_session_dir(session.id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def write_chunk(session, index, stream, length, checksum=None):
+    """
+    流式写入一个分块；重复上传同一块会覆盖
+
+    Args:
+        length: 请求体长度（Content-Length）
+        checksum: 客户端提供的该块 sha256，提供时必须一致
+
+    Returns:
+        该块的 sha256
+
+    Raises:
+        ValueError: 序号、长度或校验值不符
+        UploadInProgress: 已开始拼接
+    """
+    if session.status != UPLOADING:
+        raise UploadInProgress('上传正在完成，不能再上传分块')
+    if not 0 <= index < session.total_chunks:
+        raise ValueError(f'分块序号必须在 0 到 {session.total_chunks - 1} 之间')
+    expected = expected_length(session, index)
+    if length != expected:
+        raise ValueError(f'第 {index} 块应为 {expected} 字节，实际 {length} 字节')
+    checksum = _check_sha256(checksum, 'X-Chunk-Sha256')
+
+    directory = _session_dir(session.id)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f'.{index}-{uuid.uuid4().hex}')
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            while written < expected:
+                data = stream.read(min(COPY_BUFFER, expected - written))
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                written += len(data)
+        if written != expected:
+            raise ValueError(f'第 {index} 块不完整：收到 {written}/{expected} 字节')
+        if checksum and digest.hexdigest() != checksum:
+            raise ValueError(f'第 {index} 块校验失败')
+        # 写完再改名，中断的请求不会留下不完整的分块
+        os.replace(tmp_path, _chunk_path(session.id, index))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return digest.hexdigest()
+
+
+def _set_status(session, status, expected):
+    """条件更新会话状态（由本函数提交），返回是否更新成功"""
+    from models_media import UploadSession
+
+    table = UploadSession.__table__
+    updated = db.session.execute(
+        table.update()
+        .where(table.c.id == session.id, table.c.status == expected)
+        .values(status=status)
+    ).rowcount
+    db.session.commit()
+    return updated == 1
+
+
+def assemble(session, folder, url_prefix):
+    """
+    拼接全部分块并登记为上传文件，成功后删除会话（由本函数提交）
+
+    同一上传同时收到多个请求时只有一个执行拼接；拼接失败时会话恢复为 uploading，
+    可补传分块后重试
+
+    Returns:
+        MediaFile
+
+    Raises:
+        ValueError: 分块不全或整体校验失败
+        UploadInProgress: 另一个请求正在拼接
+    """
+    if not _set_status(session, COMPLETING, UPLOADING):
+        raise UploadInProgress('上传正在完成中，请勿重复提交')
+    try:
+        media = _assemble(session, folder, url_prefix)
+    except Exception:
+        db.session.rollback()
+        _set_status(session, UPLOADING, COMPLETING)
+        raise
+
+    discard(session)
+    return media
+
+
+def _assemble(session, folder, url_prefix):
+    from media_pipeline import store_file
+
+    missing = sorted(set(range(session.total_chunks)) - set(received_chunks(session)))
+    if missing:
+        raise ValueError(f'还有 {len(missing)} 个分块未上传: {missing[:20]}')
+
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = os.path.join(folder, f'.upload-{uuid.uuid4().hex}')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            for index in range(session.total_chunks):
+                with open(_chunk_path(session.id, index), 'rb') as chunk:
+                    while True:
+                        data = chunk.read(COPY_BUFFER)
+                        if not data:
+                            break
+                        digest.update(data)
+                        out.write(data)
+                        size += len(data)
+        if size != session.size:
+            raise ValueError(f'文件大小不符：应为 {session.size} 字节，实际 {size} 字节')
+        if session.sha256 and digest.hexdigest() != session.sha256:
+            raise ValueError('文件校验失败，请重新上传')
+        media = store_file(tmp_path, digest.hexdigest(), size, session.filename, folder, url_prefix)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return media
+
+
+def discard(session):
+    """删除会话及已上传的分块（由本函数提交）"""
+    shutil.rmtree(_session_dir(session.id), ignore_errors=True)
+    db.session.delete(session)
+    db.session.commit()
+
+
+def cleanup_expired():
+    """清理超过 SESSION_TTL 仍未完成的上传"""
+    from models_media import UploadSession
+
+    expired = UploadSession.query\
+        .filter(UploadSession.created_at < datetime.utcnow() - SESSION_TTL).all()
+    for session in expired:
+        shutil.rmtree(_session_dir(session.id), ignore_errors=True)
+        db.session.delete(session)
+    if expired:
+        db.session.commit()
+    return len(expired)
@@ -3,5 +3,21 @@
 单独文件避免循环导入
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
 db = SQLAlchemy()
+
+# 按方言选择支持 ON CONFLICT DO UPDATE 的 insert
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def upsert_insert(table):
+    """
+    当前数据库方言的 insert(table)，可使用 on_conflict_do_update / excluded
+
+    SQLite、PostgreSQL 以外的数据库抛出 NotImplementedError
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _UPSERT_INSERTS:
+        raise NotImplementedError(f'不支持在 {dialect} 数据库上执行 ON CONFLICT 写入')
+    return _UPSERT_INSERTS[dialect](table)
@@ -0,0 +1,244 @@
+"""
+五子棋房间状态缓存
+
+按房间码缓存解码后的棋盘、玩家、回合、状态和最后一步。
+写操作提交后写穿到缓存；其他 gunicorn 进程的修改通过
+gomoku_room.version 发现（每个房间至多每 REVALIDATE_INTERVAL 秒查一次）。
+长轮询请求在房间的条件变量上等待：本进程写入时立即唤醒，
+其他进程的写入在下次校验版本号时发现。
+"""
+from database import db
+from collections import OrderedDict
+import threading
+import time
+
+CACHE_MAX_ROOMS = 256  # LRU 容量
+IDLE_TTL = 30 * 60  # 秒，未结束房间闲置多久后淘汰
+FINISHED_TTL = 5 * 60  # 秒，已结束房间闲置多久后淘汰
+REVALIDATE_INTERVAL = 1  # 秒，两次检查数据库版本号的最小间隔
+EVICT_INTERVAL = 60  # 秒，TTL 扫描间隔
+
+
+class RoomState:
+    """房间状态快照（只读）"""
+
+    __slots__ = (
+        'room_id', 'room_code', 'creator_name', 'status', 'board_size',
+        'current_turn', 'winner', 'move_count', 'version',
+        'created_at', 'updated_at', 'board', 'players', 'last_move'
+    )
+
+    def __init__(self, room, players, last_move, board=None):
+        self.room_id = room.id
+        self.room_code = room.room_code
+        self.creator_name = room.creator_name
+        self.status = room.status
+        self.board_size = room.board_size
+        self.current_turn = room.current_turn
+        self.winner = room.winner
+        self.move_count = room.move_count or 0
+        self.version = room.version or 0
+        self.created_at = room.created_at
+        self.updated_at = room.updated_at
+        self.board = board if board is not None else room.load_board()
+        self.players = [p.to_dict() for p in players]
+        self.last_move = last_move.to_dict() if last_move else None
+
+    def to_dict(self, include_board=True):
+        """与 GomokuRoom.to_dict 相同的结构，另附 last_move"""
+        data = {
+            'room_code': self.room_code,
+            'creator_name': self.creator_name,
+            'status': self.status,
+            'current_turn': self.current_turn,
+            'winner': self.winner,
+            'board_size': self.board_size,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'player_count': len(self.players),
+            'move_count': self.move_count,
+            'version': self.version
+        }
+
+        if include_board:
+            data['board'] = self.board.to_list()
+            data['players'] = self.players
+
+        if self.last_move:
+            data['last_move'] = {
+                'x': self.last_move['x'],
+                'y': self.last_move['y'],
+                'color': self.last_move['player_color']
+            }
+        else:
+            data['last_move'] = None
+
+        return data
+
+
+def load_room_state(room, board=None, last_move=None):
+    """根据 ORM 对象构造 RoomState，未提供的部分从数据库查询"""
+    from models_gomoku import GomokuPlayer, GomokuMove
+
+    players = GomokuPlayer.query.filter_by(room_id=room.id)\
+        .order_by(GomokuPlayer.id).all()
+    if last_move is None and room.move_count:
+        last_move = GomokuMove.query.filter_by(room_id=room.id)\
+            .order_by(GomokuMove.move_number.desc()).first()
+    return RoomState(room, players, last_move, board)
+
+
+class _Entry:
+    __slots__ = ('state', 'accessed_at', 'validated_at')
+
+    def __init__(self, state, now):
+        self.state = state
+        self.accessed_at = now
+        self.validated_at = now
+
+
+class _Waiters:
+    """等待某个房间更新的长轮询请求（条件变量与缓存共用一把锁）"""
+    __slots__ = ('condition', 'count')
+
+    def __init__(self, lock):
+        self.condition = threading.Condition(lock)
+        self.count = 0
+
+
+class RoomCache:
+    """
+    房间状态缓存（进程内，线程安全）
+
+    LRU + 闲置 TTL 淘汰；store() 时唤醒等待该房间更新的长轮询请求
+    """
+
+    def __init__(self, max_rooms=CACHE_MAX_ROOMS, idle_ttl=IDLE_TTL,
+                 finished_ttl=FINISHED_TTL, revalidate_interval=REVALIDATE_INTERVAL):
+        self.max_rooms = max_rooms
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.revalidate_interval = revalidate_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._waiters = {}  # room_code -> _Waiters，只保留有人等待的房间
+        self._last_evict = time.monotonic()
+
+    def get(self, room_code):
+        """
+        获取房间状态
+
+        缓存命中且近期校验过时不访问数据库；否则比对数据库中的版本号，
+        版本不一致时重新加载。房间不存在返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(room_code)
+            if entry is not None:
+                entry.accessed_at = now
+                self._entries.move_to_end(room_code)
+                if now - entry.validated_at < self.revalidate_interval:
+                    return entry.state
+
+        if entry is not None:
+            from models_gomoku import GomokuRoom
+
+            version = db.session.query(GomokuRoom.version)\
+                .filter_by(room_code=room_code).scalar()
+            db.session.rollback()  # 结束读事务，下次检查能看到其他进程的提交
+            if version == entry.state.version:
+                with self._lock:
+                    entry.validated_at = time.monotonic()
+                return entry.state
+            if version is None:
+                self.invalidate(room_code)
+                return None
+
+        return self.load(room_code)
+
+    def load(self, room_code):
+        """从数据库加载房间状态并放入缓存"""
+        from models_gomoku import GomokuRoom
+
+        room = GomokuRoom.query.filter_by(room_code=room_code).first()
+        if not room:
+            self.invalidate(room_code)
+            return None
+        state = load_room_state(room)
+        db.session.rollback()
+        self.store(state)
+        return state
+
+    def store(self, state):
+        """写入（写穿）房间状态，并唤醒等待该房间的请求"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(state.room_code)
+            if entry is None or state.version >= entry.state.version:
+                self._entries[state.room_code] = _Entry(state, now)
+            self._entries.move_to_end(state.room_code)
+            self._evict(now)
+            self._notify(state.room_code)
+
+    def invalidate(self, room_code):
+        """移除房间缓存，并唤醒等待该房间的请求重新加载"""
+        with self._lock:
+            self._entries.pop(room_code, None)
+            self._notify(room_code)
+
+    def wait_for_change(self, room_code, since, timeout):
+        """
+        等待房间版本号超过 since
+
+        Returns:
+            最新的 RoomState（超时时版本号可能仍不超过 since）；房间不存在返回 None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.get(room_code)
+            remaining = deadline - time.monotonic()
+            if state is None or state.version > since or remaining <= 0:
+                return state
+
+            # 本进程写入时立即唤醒，否则到下次校验时间再检查数据库
+            with self._lock:
+                entry = self._entries.get(room_code)
+                if entry is not None and entry.state.version > since:
+                    continue
+                waiters = self._waiters.get(room_code)
+                if waiters is None:
+                    waiters = self._waiters[room_code] = _Waiters(self._lock)
+                waiters.count += 1
+                try:
+                    waiters.condition.wait(min(self.revalidate_interval, remaining))
+                finally:
+                    waiters.count -= 1
+                    if not waiters.count:
+                        del self._waiters[room_code]
+
+    def _notify(self, room_code):
+        """唤醒等待该房间的请求（需持有锁）"""
+        waiters = self._waiters.get(room_code)
+        if waiters is not None:
+            waiters.condition.notify_all()
+
+    def _evict(self, now):
+        """淘汰超出容量或闲置过久的房间（需持有锁）"""
+        while len(self._entries) > self.max_rooms:
+            self._entries.popitem(last=False)
+
+        if now - self._last_evict < EVICT_INTERVAL:
+            return
+        self._last_evict = now
+
+        expired = [
+            code for code, entry in self._entries.items()
+            if now - entry.accessed_at > (
+                self.finished_ttl if entry.state.status == 'finished' else self.idle_ttl
+            )
+        ]
+        for code in expired:
+            del self._entries[code]
+
+
+room_cache = RoomCache()
@@ -1,6 +1,7 @@
 """
 五子棋游戏逻辑
 """
+import json
 
 
 def check_winner(board, x, y, color):
@@ -97,3 +98,122 @@ def value_to_color(value):
     elif value == 2:
         return 'white'
     return None
+
+
+# 棋盘状态的紧凑编码：每个格子一个字符（'0'空, '1'黑, '2'白），按 board[x][y] 行优先展开
+_CELL_TO_CHAR = bytes.maketrans(b'\x00\x01\x02', b'012')
+_CHAR_TO_CELL = bytes.maketrans(b'012', b'\x00\x01\x02')
+
+_DIRECTIONS = (
+    (0, 1),   # 横向
+    (1, 0),   # 纵向
+    (1, 1),   # 右下斜
+    (1, -1)   # 右上斜
+)
+
+
+class GomokuBoard:
+    """
+    紧凑棋盘引擎
+
+    使用一维 bytearray 存储棋盘（下标 x * size + y），
+    落子/悔棋均为 O(1)，胜负判断只检查最后落子所在的四条线。
+    """
+
+    __slots__ = ('size', 'cells', 'stones')
+
+    def __init__(self, size=15, cells=None, stones=None):
+        self.size = size
+        if cells is None:
+            cells = bytearray(size * size)
+        self.cells = cells
+        # 已知棋子数（如房间的 move_count）时直接使用，避免扫描棋盘
+        self.stones = size * size - cells.count(0) if stones is None else stones
+
+    @classmethod
+    def from_state(cls, state, size=15, stones=None):
+        """
+        从数据库中的 board_state 还原棋盘
+
+        兼容旧版 JSON 二维数组格式
+        """
+        if not state or state == '[]':
+            return cls(size)
+        if state[0] == '[':
+            rows = json.loads(state)
+            return cls(len(rows), bytearray(v for row in rows for v in row))
+        return cls(size, bytearray(state.encode('ascii')).translate(_CHAR_TO_CELL), stones)
+
+    @classmethod
+    def from_list(cls, rows):
+        """从二维数组构造棋盘"""
+        return cls(len(rows), bytearray(v for row in rows for v in row))
+
+    def to_state(self):
+        """编码为 board_state 字符串"""
+        return self.cells.translate(_CELL_TO_CHAR).decode('ascii')
+
+    def to_list(self):
+        """转换为 API 使用的二维数组 board[x][y]"""
+        size = self.size
+        cells = self.cells
+        return [list(cells[i:i + size]) for i in range(0, size * size, size)]
+
+    def get(self, x, y):
+        return self.cells[x * self.size + y]
+
+    def validate(self, x, y):
+        """
+        验证落子是否合法
+
+        Returns:
+            (is_valid, error_message)
+        """
+        if x < 0 or x >= self.size or y < 0 or y >= self.size:
+            return False, "坐标超出范围"
+
+        if self.cells[x * self.size + y] != 0:
+            return False, "该位置已有棋子"
+
+        return True, None
+
+    def place(self, x, y, color):
+        """落子（不做合法性检查）"""
+        self.cells[x * self.size + y] = color
+        self.stones += 1
+
+    def undo(self, x, y):
+        """撤销 (x, y) 处的棋子"""
+        self.cells[x * self.size + y] = 0
+        self.stones -= 1
+
+    def is_full(self):
+        """检查棋盘是否已满（平局）"""
+        return self.stones >= self.size * self.size
+
+    def check_five(self, x, y, color):
+        """
+        以 (x, y) 为中心检查是否连成五子
+
+        Returns:
+            (is_win, winning_line): 与 check_winner 相同
+        """
+        size = self.size
+        cells = self.cells
+
+        for dx, dy in _DIRECTIONS:
+            line = [(x, y)]
+
+            for sign in (1, -1):
+                nx, ny = x + dx * sign, y + dy * sign
+                while 0 <= nx < size and 0 <= ny < size and cells[nx * size + ny] == color:
+                    line.append((nx, ny))
+                    nx += dx * sign
+                    ny += dy * sign
+
+            if len(line) >= 5:
+                line.sort()
+                winning_line = line[:5] if len(line) == 5 else line[len(line)//2-2:len(line)//2+3]
+                return True, winning_line
+
+        return False, []
@@ -0,0 +1,14 @@
+"""
+gunicorn 配置
+用法: gunicorn -c gunicorn.conf.py app:app
+
+使用 gthread worker：五子棋 /api/gomoku/rooms/<code>/updates 长轮询等待时
+只占用一个线程，同一进程的其他线程继续处理请求（包括唤醒等待者的走棋请求）
+"""
+bind = '0.0.0.0:5000'
+workers = 4
+worker_class = 'gthread'
+# 需大于 api_gomoku.MAX_LONG_POLL_WAITERS，留出线程处理其他请求
+threads = 32
+# 需大于 api_gomoku.LONG_POLL_TIMEOUT
+timeout = 60
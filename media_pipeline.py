@@ -0,0 +1,248 @@
+"""
+上传文件处理
+- 上传内容分块写入磁盘，同时计算 sha256，相同内容只保存一份
+- 图片由后台线程池生成多种宽度的缩放图和 WebP 版本，结果记录在 media_file 表
+- Pillow 为可选依赖，未安装时只保存原图
+"""
+from database import db
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+CHUNK_SIZE = 64 * 1024  # 写入磁盘的块大小
+VARIANT_WIDTHS = (320, 640, 1280, 1920)  # 生成的缩放宽度（只生成小于原图的）
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+MEDIA_WORKERS = 2  # 图片处理线程数
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+_SAVE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def save_upload(file, folder, url_prefix):
+    """
+    保存上传文件，按内容去重（由本函数提交）
+
+    Args:
+        file: werkzeug FileStorage
+        folder: 保存目录，如 static/uploads/blog
+        url_prefix: 对应的 URL 前缀，如 /static/uploads/blog
+
+    Returns:
+        MediaFile；新上传的图片会提交到后台生成缩放图
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    # 边读边写临时文件并计算哈希，不把整个文件读入内存
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(folder, f'.upload-{uuid.uuid4().hex}')
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        return store_file(tmp_path, digest.hexdigest(), size, file.filename, folder, url_prefix)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_file(tmp_path, sha256, size, original_name, folder, url_prefix):
+    """
+    把已写入磁盘的临时文件登记为上传文件（由本函数提交）
+
+    tmp_path 需与 folder 在同一文件系统；内容已存在时直接返回已有记录，
+    临时文件由调用方删除
+
+    Returns:
+        MediaFile
+    """
+    from models_media import MediaFile
+    from sqlalchemy.exc import IntegrityError
+
+    ext = _extension(original_name)
+
+    media = MediaFile.query.filter_by(sha256=sha256).first()
+    if media is not None:
+        # 相同内容已上传过；文件被误删时按原 URL 恢复
+        path = media.url.lstrip('/')
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return media
+
+    filename = f'{sha256[:16]}.{ext}' if ext else sha256[:16]
+    os.replace(tmp_path, os.path.join(folder, filename))
+
+    media = MediaFile(
+        sha256=sha256,
+        url=f'{url_prefix}/{filename}',
+        original_name=original_name[:255],
+        size=size,
+        status='pending' if ext in IMAGE_EXTENSIONS else 'skipped'
+    )
+    db.session.add(media)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 并发上传了相同内容
+        db.session.rollback()
+        return MediaFile.query.filter_by(sha256=sha256).first()
+
+    if media.status == 'pending':
+        from flask import current_app
+        submit(current_app._get_current_object(), media.id)
+    return media
+
+
+def submit(app, media_id):
+    """把图片提交到后台线程池处理"""
+    global _executor, _executor_pid
+    # gunicorn 预加载后 fork 的子进程需要新建线程池
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix='media')
+            _executor_pid = os.getpid()
+        _executor.submit(_process_in_app, app, media_id)
+
+
+def _process_in_app(app, media_id):
+    with app.app_context():
+        try:
+            process_image(media_id)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f'处理图片 {media_id} 失败: {e}')
+
+
+def process_image(media_id):
+    """生成缩放图和 WebP 版本并记录到 media_file（需在应用上下文中调用）"""
+    from models_media import MediaFile
+
+    media = db.session.get(MediaFile, media_id)
+    if media is None:
+        return
+
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        media.status = 'skipped'
+        db.session.commit()
+        return
+
+    path = media.url.lstrip('/')
+    base, ext = os.path.splitext(path)
+    url_base = os.path.splitext(media.url)[0]
+    fmt = _SAVE_FORMATS.get(ext[1:].lower())
+
+    try:
+        with Image.open(path) as image:
+            animated = getattr(image, 'is_animated', False)
+            image = ImageOps.exif_transpose(image)
+            media.width, media.height = image.size
+
+            variants = []
+            # 动图缩放会丢失动画，只记录尺寸
+            if fmt and not animated:
+                widths = [w for w in VARIANT_WIDTHS if w < image.width]
+                for width in widths:
+                    height = max(1, round(image.height * width / image.width))
+                    resized = image.resize((width, height), Image.LANCZOS)
+                    if fmt != 'WEBP':
+                        variants.append(_save_variant(resized, fmt, f'{base}-{width}w{ext}', f'{url_base}-{width}w{ext}', width))
+                    variants.append(_save_variant(resized, 'WEBP', f'{base}-{width}w.webp', f'{url_base}-{width}w.webp', width))
+                # 原图不超过最大缩放宽度时额外生成同尺寸 WebP
+                if fmt != 'WEBP' and image.width <= VARIANT_WIDTHS[-1]:
+                    variants.append(_save_variant(image, 'WEBP', f'{base}.webp', f'{url_base}.webp', image.width))
+
+        media.variants = json.dumps(variants)
+        media.status = 'ready'
+    except Exception as e:
+        media.status = 'failed'
+        logging.error(f'生成图片变体失败 {media.url}: {e}')
+    db.session.commit()
+
+
+def _save_variant(image, fmt, path, url, width):
+    if fmt == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        image.save(path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(path, fmt, optimize=True)
+    return {
+        'width': width,
+        'format': 'webp' if fmt == 'WEBP' else fmt.lower(),
+        'url': url,
+        'size': os.path.getsize(path)
+    }
+
+
+def process_pending_media():
+    """
+    同步处理所有未完成的图片（进程在处理完成前退出时使用）
+
+    Returns:
+        处理的图片数
+    """
+    from models_media import MediaFile
+
+    ids = [m.id for m in MediaFile.query.filter(MediaFile.status.in_(('pending', 'failed')))]
+    for media_id in ids:
+        process_image(media_id)
+    return len(ids)
+
+
+def get_srcsets(urls):
+    """
+    批量查询图片 URL 对应的 srcset
+
+    Returns:
+        {url: {'srcset': ..., 'webp_srcset': ...}}，只包含已生成变体的图片
+    """
+    from models_media import MediaFile
+
+    normalized = {}
+    for url in urls:
+        if url:
+            normalized['/' + url.lstrip('/')] = url
+    if not normalized:
+        return {}
+
+    result = {}
+    for media in MediaFile.query.filter(MediaFile.url.in_(list(normalized)), MediaFile.status == 'ready'):
+        srcset, webp_srcset = media.get_srcsets()
+        if srcset:
+            result[normalized[media.url]] = {'srcset': srcset, 'webp_srcset': webp_srcset}
+    return result
+
+
+def attach_srcsets(items, key='thumbnail'):
+    """给序列化后的字典列表加上 {key}_srcset / {key}_webp_srcset"""
+    srcsets = get_srcsets(item.get(key) for item in items)
+    for item in items:
+        found = srcsets.get(item.get(key)) or {}
+        item[f'{key}_srcset'] = found.get('srcset')
+        item[f'{key}_webp_srcset'] = found.get('webp_srcset')
+    return items
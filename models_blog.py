@@ -0,0 +1,216 @@
+"""
+博客标签和分类索引表
+blog_post.tags / blog_post.category 仍保存原始值，这里维护规范化的索引表和
+各标签、分类下已发布文章数，按标签/分类筛选和统计时不再扫描文章表
+另有单行的列表版本号表，文章列表缓存和 ETag 以它为指纹
+"""
+from database import db
+from datetime import datetime
+
+# 文章-标签关联表，主键 (post_id, tag_id)，另建 (tag_id, post_id) 索引用于按标签查文章
+post_tag = db.Table(
+    'post_tag',
+    db.Column('post_id', db.Integer, db.ForeignKey('blog_post.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_post_tag_tag', 'tag_id', 'post_id')
+)
+
+
+class Tag(db.Model):
+    """标签"""
+    __tablename__ = 'tag'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    post_count = db.Column(db.Integer, default=0, nullable=False)  # 已发布文章数
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'post_count': self.post_count
+        }
+
+
+class Category(db.Model):
+    """分类"""
+    __tablename__ = 'category'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    post_count = db.Column(db.Integer, default=0, nullable=False)  # 已发布文章数
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'post_count': self.post_count
+        }
+
+
+class BlogListingVersion(db.Model):
+    """
+    文章列表版本号（单行表）
+    文章增删改、标签分类重建时加一，读取指纹只需按主键查一行，不再扫描文章表
+    """
+    __tablename__ = 'blog_listing_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+LISTING_VERSION_ID = 1
+
+
+def get_listing_version():
+    """返回 (版本号, 最后修改时间)，尚未有修改时为 (0, None)"""
+    row = db.session.execute(
+        db.select(BlogListingVersion.version, BlogListingVersion.updated_at)
+        .where(BlogListingVersion.id == LISTING_VERSION_ID)
+    ).first()
+    return tuple(row) if row else (0, None)
+
+
+def bump_listing_version():
+    """文章列表内容变化时调用，与修改在同一事务中（由调用方提交）"""
+    table = BlogListingVersion.__table__
+    now = datetime.utcnow()
+    updated = db.session.execute(
+        table.update().where(table.c.id == LISTING_VERSION_ID)
+        .values(version=table.c.version + 1, updated_at=now)
+    ).rowcount
+    if not updated:
+        db.session.execute(table.insert().values(id=LISTING_VERSION_ID, version=1, updated_at=now))
+
+
+def parse_tags(value):
+    """
+    把标签列表或逗号分隔的字符串规范化为去重后的标签列表（保持顺序）
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    tags = []
+    for name in value:
+        name = str(name).strip()[:50]
+        if name and name not in tags:
+            tags.append(name)
+    return tags
+
+
+def _get_or_create(model, name):
+    item = model.query.filter_by(name=name).first()
+    if item is None:
+        item = model(name=name, post_count=0)
+        db.session.add(item)
+        db.session.flush()
+    return item
+
+
+def _refresh_tag_counts(tag_ids):
+    if not tag_ids:
+        return
+    db.session.execute(db.text(
+        'UPDATE tag SET post_count = ('
+        'SELECT COUNT(*) FROM post_tag JOIN blog_post ON blog_post.id = post_tag.post_id '
+        'WHERE post_tag.tag_id = tag.id AND blog_post.is_published = 1'
+        ') WHERE id IN :ids'
+    ).bindparams(db.bindparam('ids', expanding=True)), {'ids': list(tag_ids)})
+
+
+def _refresh_category_counts(names):
+    names = [name for name in names if name]
+    if not names:
+        return
+    db.session.execute(db.text(
+        'UPDATE category SET post_count = ('
+        'SELECT COUNT(*) FROM blog_post '
+        'WHERE blog_post.category = category.name AND blog_post.is_published = 1'
+        ') WHERE name IN :names'
+    ).bindparams(db.bindparam('names', expanding=True)), {'names': names})
+
+
+def sync_post_taxonomy(post, old_category=None):
+    """
+    根据 post.tags / post.category 更新索引表和相关计数（由调用方提交）
+
+    post 需已 flush 获得 id；post.tags 会被改写为规范化后的逗号分隔字符串
+
+    Args:
+        old_category: 修改前的分类，用于更新原分类的文章数
+    """
+    names = parse_tags(post.tags)
+    post.tags = ','.join(names)
+    db.session.flush()
+
+    old_ids = set(db.session.execute(
+        db.select(post_tag.c.tag_id).where(post_tag.c.post_id == post.id)
+    ).scalars())
+    new_ids = {_get_or_create(Tag, name).id for name in names}
+
+    if old_ids - new_ids:
+        db.session.execute(post_tag.delete().where(
+            post_tag.c.post_id == post.id,
+            post_tag.c.tag_id.in_(old_ids - new_ids)
+        ))
+    if new_ids - old_ids:
+        db.session.execute(post_tag.insert(), [
+            {'post_id': post.id, 'tag_id': tag_id} for tag_id in new_ids - old_ids
+        ])
+
+    if post.category:
+        _get_or_create(Category, post.category)
+
+    # 发布状态变化也会影响计数，因此新旧标签、分类都重新统计
+    _refresh_tag_counts(old_ids | new_ids)
+    _refresh_category_counts({post.category, old_category})
+
+
+def remove_post_taxonomy(post):
+    """删除文章并 flush 后调用：移除关联并更新计数（由调用方提交）"""
+    tag_ids = set(db.session.execute(
+        db.select(post_tag.c.tag_id).where(post_tag.c.post_id == post.id)
+    ).scalars())
+    db.session.execute(post_tag.delete().where(post_tag.c.post_id == post.id))
+    _refresh_tag_counts(tag_ids)
+    _refresh_category_counts([post.category])
+
+
+def rebuild_taxonomy():
+    """
+    根据 blog_post 表重建标签、分类索引表和计数
+
+    Returns:
+        (标签数, 分类数)
+    """
+    from app import BlogPost
+
+    db.session.execute(post_tag.delete())
+    tag_ids = {tag.name: tag.id for tag in Tag.query}
+    category_names = {name for (name,) in db.session.query(Category.name)}
+
+    rows = []
+    for post_id, tags, category in db.session.query(BlogPost.id, BlogPost.tags, BlogPost.category).all():
+        for name in parse_tags(tags):
+            if name not in tag_ids:
+                tag_ids[name] = _get_or_create(Tag, name).id
+            rows.append({'post_id': post_id, 'tag_id': tag_ids[name]})
+        if category and category not in category_names:
+            _get_or_create(Category, category)
+            category_names.add(category)
+    if rows:
+        db.session.execute(post_tag.insert(), rows)
+
+    db.session.execute(db.text(
+        'UPDATE tag SET post_count = ('
+        'SELECT COUNT(*) FROM post_tag JOIN blog_post ON blog_post.id = post_tag.post_id '
+        'WHERE post_tag.tag_id = tag.id AND blog_post.is_published = 1)'
+    ))
+    db.session.execute(db.text(
+        'UPDATE category SET post_count = ('
+        'SELECT COUNT(*) FROM blog_post '
+        'WHERE blog_post.category = category.name AND blog_post.is_published = 1)'
+    ))
+    bump_listing_version()
+    db.session.commit()
+    return len(tag_ids), len(category_names)
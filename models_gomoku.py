@@ -3,9 +3,9 @@
 """
 from database import db
 from datetime import datetime
+from gomoku_logic import GomokuBoard
 import random
 import string
-import json
 
 
 def generate_room_code():
@@ -21,13 +21,21 @@ class GomokuRoom(db.Model):
     room_code = db.Column(db.String(6), unique=True, nullable=False, index=True)
     creator_name = db.Column(db.String(50), nullable=False)
     status = db.Column(db.String(20), default='waiting', nullable=False)  # waiting, playing, finished
-    board_state = db.Column(db.Text, default='[]')  # JSON格式的15x15数组
+    board_state = db.Column(db.Text, default='[]')  # 紧凑编码的棋盘，见 GomokuBoard.to_state
     board_size = db.Column(db.Integer, default=15)
     current_turn = db.Column(db.String(10), default='black')  # black, white
     winner = db.Column(db.String(50))
+    move_count = db.Column(db.Integer, default=0, nullable=False)  # 已落子数，与落子记录在同一事务中更新
+    version = db.Column(db.Integer, default=0, nullable=False)  # 房间状态版本号，每次变更加1
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 乐观锁：UPDATE 时校验 version，其他进程已修改则抛出 StaleDataError
+    __mapper_args__ = {
+        'version_id_col': version,
+        'version_id_generator': False
+    }
+    
     # 关系
     players = db.relationship('GomokuPlayer', backref='room', lazy=True, cascade='all, delete-orphan')
     moves = db.relationship('GomokuMove', backref='room', lazy=True, cascade='all, delete-orphan')
@@ -38,16 +46,26 @@ class GomokuRoom(db.Model):
             self.room_code = generate_room_code()
         if not self.board_state or self.board_state == '[]':
             # 初始化空棋盘
-            size = self.board_size or 15
-            self.board_state = json.dumps([[0] * size for _ in range(size)])
+            self.board_state = GomokuBoard(self.board_size or 15).to_state()
+    
+    def touch(self):
+        """标记房间状态已变更"""
+        self.version = (self.version or 0) + 1
+        self.updated_at = datetime.utcnow()
+    
+    def load_board(self):
+        """获取棋盘引擎对象"""
+        return GomokuBoard.from_state(self.board_state, self.board_size or 15, self.move_count)
     
     def get_board(self):
         """获取棋盘数组"""
-        return json.loads(self.board_state)
+        return self.load_board().to_list()
     
     def set_board(self, board):
-        """设置棋盘数组"""
-        self.board_state = json.dumps(board)
+        """设置棋盘（GomokuBoard 或二维数组）"""
+        if not isinstance(board, GomokuBoard):
+            board = GomokuBoard.from_list(board)
+        self.board_state = board.to_state()
     
     def to_dict(self, include_board=True):
         """转换为字典"""
@@ -61,7 +79,8 @@ class GomokuRoom(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'player_count': len(self.players),
-            'move_count': len(self.moves)
+            'move_count': self.move_count or 0,
+            'version': self.version or 0
         }
         
         if include_board:
@@ -96,6 +115,9 @@ class GomokuPlayer(db.Model):
 class GomokuMove(db.Model):
     """五子棋走棋记录"""
     __tablename__ = 'gomoku_move'
+    __table_args__ = (
+        db.Index('ix_gomoku_move_room_number', 'room_id', 'move_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey('gomoku_room.id'), nullable=False)
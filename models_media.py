@@ -0,0 +1,90 @@
+"""
+上传文件记录
+文件按内容哈希命名和去重，图片额外记录生成的尺寸变体，供接口返回 srcset
+"""
+from database import db
+from datetime import datetime
+import json
+
+
+class MediaFile(db.Model):
+    """上传的文件"""
+    __tablename__ = 'media_file'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    url = db.Column(db.String(255), unique=True, nullable=False)  # 原文件 URL
+    original_name = db.Column(db.String(255))
+    size = db.Column(db.Integer, default=0, nullable=False)
+    width = db.Column(db.Integer)  # 图片宽高（处理完成后写入）
+    height = db.Column(db.Integer)
+    variants = db.Column(db.Text)  # JSON: [{"width": 640, "format": "webp", "url": ...}, ...]
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending/ready/failed/skipped
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def get_variants(self):
+        return json.loads(self.variants) if self.variants else []
+
+    def get_srcsets(self):
+        """
+        返回 (原格式 srcset, WebP srcset)，没有变体时为 None
+        """
+        if self.status != 'ready' or not self.width:
+            return None, None
+        variants = self.get_variants()
+        if not variants:
+            return None, None
+
+        original = [v for v in variants if v['format'] != 'webp']
+        webp = [v for v in variants if v['format'] == 'webp']
+        srcset = ', '.join(
+            [f"{v['url']} {v['width']}w" for v in original] + [f'{self.url} {self.width}w']
+        )
+        webp_entries = [f"{v['url']} {v['width']}w" for v in webp]
+        if self.url.endswith('.webp'):
+            webp_entries.append(f'{self.url} {self.width}w')
+        webp_srcset = ', '.join(webp_entries) or None
+        return srcset, webp_srcset
+
+    def to_dict(self):
+        srcset, webp_srcset = self.get_srcsets()
+        return {
+            'id': self.id,
+            'url': self.url,
+            'sha256': self.sha256,
+            'size': self.size,
+            'width': self.width,
+            'height': self.height,
+            'status': self.status,
+            'variants': self.get_variants(),
+            'srcset': srcset,
+            'webp_srcset': webp_srcset
+        }
+
+
+class UploadSession(db.Model):
+    """分块上传会话，已收到的分块以文件形式保存在 upload_chunks/<id>/ 下"""
+    __tablename__ = 'upload_session'
+
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    total_chunks = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64))  # 整个文件的校验值（可选）
+    status = db.Column(db.String(20), default='uploading', nullable=False)  # uploading/completing
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self, received=None):
+        data = {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'status': self.status,
+            'created_at': self.created_at.isoformat()
+        }
+        if received is not None:
+            data['received'] = received
+        return data
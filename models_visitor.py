@@ -0,0 +1,143 @@
+"""
+访客统计汇总表
+按小时和按天、按页面累计访问量，统计接口直接读取汇总表而不扫描 visitor 表
+"""
+from database import db, upsert_insert
+from collections import Counter
+from datetime import datetime, timedelta
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'  # SQLite 中 DateTime 列的存储格式
+
+
+class VisitorHourly(db.Model):
+    """按小时汇总的访问量"""
+    __tablename__ = 'visitor_hourly'
+
+    bucket = db.Column(db.DateTime, primary_key=True)  # 整点时间
+    page = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+
+class VisitorDaily(db.Model):
+    """按天汇总的访问量"""
+    __tablename__ = 'visitor_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    page = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+
+def _upsert_counts(table, key, counts):
+    """累加计数：已有 (key, page) 时 count += n"""
+    if not counts:
+        return
+    stmt = upsert_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key, 'page'],
+        set_={'count': table.c.count + stmt.excluded.count}
+    )
+    db.session.execute(stmt, [
+        {key: k, 'page': page, 'count': n} for (k, page), n in counts.items()
+    ])
+
+
+def add_visits_to_rollups(rows):
+    """
+    把一批新写入的访客记录累加到汇总表（与插入访客记录在同一事务中）
+
+    Args:
+        rows: [{'visit_time': datetime, 'page': str, ...}, ...]
+    """
+    hourly = Counter()
+    daily = Counter()
+    for row in rows:
+        visit_time = row['visit_time']
+        page = row.get('page') or '/'
+        hourly[(visit_time.replace(minute=0, second=0, microsecond=0), page)] += 1
+        daily[(visit_time.date(), page)] += 1
+
+    _upsert_counts(VisitorHourly.__table__, 'bucket', hourly)
+    _upsert_counts(VisitorDaily.__table__, 'day', daily)
+
+
+def rebuild_visitor_rollups():
+    """
+    根据 visitor 表重建汇总数据
+
+    只重建 visitor 表中仍有原始记录的时间段，已归档时间段的汇总保持不变。
+    归档/清理的截止时间可能在一天（一小时）中间，最早记录所在的小时和天的原始记录可能不完整：
+    这两个时间段已有的汇总保持不变，只补上缺失的行；之后的时间段删除后重新汇总。
+
+    Returns:
+        参与汇总的访客记录数
+    """
+    start = db.session.execute(db.text('SELECT MIN(visit_time) FROM visitor')).scalar()
+    if start is None:
+        return 0
+
+    start = datetime.fromisoformat(str(start))
+    first_hour = start.replace(minute=0, second=0, microsecond=0)
+    first_day = first_hour.replace(hour=0)
+    # 与 visit_time/bucket 的存储格式一致，按字符串比较
+    params = {
+        'first_hour': first_hour.strftime(_TIME_FORMAT),
+        'next_hour': (first_hour + timedelta(hours=1)).strftime(_TIME_FORMAT),
+        'first_day': first_day.strftime(_TIME_FORMAT),
+        'next_day': (first_day + timedelta(days=1)).strftime(_TIME_FORMAT),
+        'next_date': (first_day + timedelta(days=1)).date().isoformat()
+    }
+    hourly_sql = (
+        "INSERT {verb} INTO visitor_hourly (bucket, page, count) "
+        "SELECT strftime('%Y-%m-%d %H:00:00.000000', visit_time), COALESCE(page, '/'), COUNT(*) "
+        "FROM visitor WHERE {where} GROUP BY 1, 2"
+    )
+    daily_sql = (
+        "INSERT {verb} INTO visitor_daily (day, page, count) "
+        "SELECT date(visit_time), COALESCE(page, '/'), COUNT(*) "
+        "FROM visitor WHERE {where} GROUP BY 1, 2"
+    )
+
+    # 完整的时间段：删除后重新汇总
+    db.session.execute(db.text('DELETE FROM visitor_hourly WHERE bucket >= :next_hour'), params)
+    db.session.execute(db.text('DELETE FROM visitor_daily WHERE day >= :next_date'), params)
+    db.session.execute(db.text(hourly_sql.format(verb='', where='visit_time >= :next_hour')), params)
+    db.session.execute(db.text(daily_sql.format(verb='', where='visit_time >= :next_day')), params)
+
+    # 可能被截断的最早一小时和一天：已有汇总（包含已归档的记录）优先
+    db.session.execute(db.text(hourly_sql.format(
+        verb='OR IGNORE', where='visit_time >= :first_hour AND visit_time < :next_hour'
+    )), params)
+    db.session.execute(db.text(daily_sql.format(
+        verb='OR IGNORE', where='visit_time >= :first_day AND visit_time < :next_day'
+    )), params)
+
+    total = db.session.execute(db.text('SELECT COUNT(*) FROM visitor')).scalar()
+    db.session.commit()
+    return total
+
+
+def count_visits(page=None, since=None, day=None):
+    """
+    从汇总表统计访问量
+
+    Args:
+        page: 只统计指定页面
+        since: 只统计该时间所在整点及之后（按小时汇总表计算）
+        day: 只统计该日（UTC 日期，按天汇总表计算）
+    """
+    if day is not None:
+        query = db.session.query(db.func.sum(VisitorDaily.count))\
+            .filter(VisitorDaily.day == day)
+        model = VisitorDaily
+    elif since is not None:
+        query = db.session.query(db.func.sum(VisitorHourly.count))\
+            .filter(VisitorHourly.bucket >= since.replace(minute=0, second=0, microsecond=0))
+        model = VisitorHourly
+    else:
+        query = db.session.query(db.func.sum(VisitorDaily.count))
+        model = VisitorDaily
+
+    if page is not None:
+        query = query.filter(model.page == page)
+
+    return query.scalar() or 0
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+预约并发压力测试
+多个进程（模拟 gunicorn worker）× 多个线程同时提交互相重叠的预约，
+结束后检查数据库中是否存在重叠的预约
+
+用法:
+  python scripts/bench_booking.py [请求总数] [进程数] [每进程线程数]
+
+使用临时数据库，不影响 homepage.db；存在重复预约时退出码为 1
+"""
+import sys
+import os
+import multiprocessing
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATES = 3  # 请求集中在几天内，制造大量冲突
+SLOTS = 48  # 每天 48 个半小时时段
+
+
+def random_request(rng, base_date):
+    start = rng.randrange(SLOTS - 4)
+    end = start + rng.randint(1, 4)
+    return {
+        'name': f'bench-{rng.randrange(1000)}',
+        'dept': 'bench',
+        'date': (base_date + timedelta(days=rng.randrange(DATES))).isoformat(),
+        'start': f'{start // 2:02d}:{start % 2 * 30:02d}',
+        'end': f'{end // 2:02d}:{end % 2 * 30:02d}'
+    }
+
+
+def worker(requests, threads, seed, base_date, results):
+    """子进程：多个线程并发发送预约请求"""
+    from app import app
+
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def run(count, thread_seed):
+        rng = random.Random(thread_seed)
+        client = app.test_client()
+        for _ in range(count):
+            response = client.post('/api/booking/reserve', json=random_request(rng, base_date))
+            with lock:
+                statuses[response.status_code] += 1
+
+    per_thread = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=run, args=(n, seed * 1000 + i)) for i, n in enumerate(per_thread)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(dict(statuses))
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_booking_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()  # 子进程各自建立连接
+
+    print("=" * 50)
+    print(f"预约并发测试: {total} 个请求, {processes} 个进程 × {threads} 个线程")
+    print("=" * 50)
+
+    base_date = date.today() + timedelta(days=1)
+    results = multiprocessing.Queue()
+    per_process = [total // processes + (1 if i < total % processes else 0) for i in range(processes)]
+    started = time.perf_counter()
+    children = [
+        multiprocessing.Process(target=worker, args=(n, threads, i, base_date, results))
+        for i, n in enumerate(per_process)
+    ]
+    for p in children:
+        p.start()
+    statuses = Counter()
+    for _ in children:
+        statuses.update(results.get())
+    for p in children:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        bookings = db.session.execute(db.text('SELECT COUNT(*) FROM booking')).scalar()
+        overlaps = db.session.execute(db.text(
+            'SELECT COUNT(*) FROM booking a JOIN booking b '
+            'ON a.date = b.date AND a.id < b.id '
+            'AND a.start_time < b.end_time AND b.start_time < a.end_time'
+        )).scalar()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"\n耗时: {elapsed:.2f}s ({total / elapsed:.0f} 请求/秒)")
+    print(f"201 成功: {statuses.get(201, 0)}")
+    print(f"409 冲突: {statuses.get(409, 0)}")
+    print(f"503 繁忙: {statuses.get(503, 0)}")
+    others = {k: v for k, v in statuses.items() if k not in (201, 409, 503)}
+    if others:
+        print(f"其他状态: {others}")
+    print(f"数据库中的预约: {bookings}")
+
+    if overlaps or bookings != statuses.get(201, 0):
+        print(f"\n✗ 发现 {overlaps} 对重叠预约（成功响应 {statuses.get(201, 0)} 个）")
+        return False
+    print("\n✓ 没有重复预约")
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+SQLite 读写竞争测试
+多个读进程和写进程（模拟 gunicorn worker）同时访问同一个数据库，
+分别使用 SQLite 默认设置（回滚日志）和 sqlite_tuning 的设置（WAL 等）运行，对比吞吐、延迟和锁错误
+
+用法:
+  python scripts/bench_sqlite.py [每种模式运行秒数] [读进程数] [写进程数]
+
+使用临时数据库，不影响 homepage.db
+"""
+import sys
+import os
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlite_tuning import engine_options, apply_pragmas, BUSY_TIMEOUT_MS
+
+SEED_ROWS = 200000
+READ_WINDOW = 20000  # 每次读取的行数范围
+
+
+def make_engine(url, tuned):
+    if tuned:
+        engine = create_engine(url, **engine_options(url))
+        event.listen(engine, 'connect', lambda conn, record: apply_pragmas(conn))
+    else:
+        engine = create_engine(url, connect_args={'timeout': BUSY_TIMEOUT_MS / 1000})
+    return engine
+
+
+def seed(url):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE bench (id INTEGER PRIMARY KEY, page VARCHAR(255), created_at FLOAT NOT NULL)'
+        )
+        conn.exec_driver_sql('CREATE INDEX ix_bench_page ON bench (page)')
+        conn.exec_driver_sql(
+            'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) '
+            "INSERT INTO bench (page, created_at) SELECT '/page/' || (i % 50), i FROM n",
+            (SEED_ROWS,)
+        )
+    engine.dispose()
+
+
+def worker(url, tuned, role, seconds, seed_value, results):
+    """子进程：读进程反复执行范围统计，写进程每次插入一行并提交（类似访客记录）"""
+    import random
+
+    rng = random.Random(seed_value)
+    engine = make_engine(url, tuned)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'read':
+                with engine.connect() as conn:
+                    low = rng.randrange(SEED_ROWS)
+                    conn.exec_driver_sql(
+                        'SELECT page, COUNT(*) FROM bench WHERE id BETWEEN ? AND ? GROUP BY page',
+                        (low, low + READ_WINDOW)
+                    ).all()
+            else:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(
+                        'INSERT INTO bench (page, created_at) VALUES (?, ?)',
+                        (f'/page/{rng.randrange(50)}', time.time())
+                    )
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    engine.dispose()
+    results.put((role, latencies, errors))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(tuned, seconds, readers, writers):
+    tmp_dir = tempfile.mkdtemp(prefix='bench_sqlite_')
+    url = 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+    seed(url)
+
+    results = multiprocessing.Queue()
+    roles = ['read'] * readers + ['write'] * writers
+    children = [
+        multiprocessing.Process(target=worker, args=(url, tuned, role, seconds, i, results))
+        for i, role in enumerate(roles)
+    ]
+    for p in children:
+        p.start()
+    collected = {'read': ([], 0), 'write': ([], 0)}
+    for _ in children:
+        role, latencies, errors = results.get()
+        total_latencies, total_errors = collected[role]
+        collected[role] = (total_latencies + latencies, total_errors + errors)
+    for p in children:
+        p.join()
+
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"\n[{'调优 (WAL, synchronous=NORMAL)' if tuned else '默认 (回滚日志, synchronous=FULL)'}]")
+    for role, label in (('read', '读'), ('write', '写')):
+        latencies, errors = collected[role]
+        print(f"  {label}: {len(latencies) / seconds:8.0f} 次/秒  "
+              f"p50 {percentile(latencies, 0.5) * 1000:7.2f}ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:7.2f}ms  "
+              f"锁错误 {errors}")
+    return collected
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    print("=" * 50)
+    print(f"SQLite 读写竞争测试: {readers} 个读进程, {writers} 个写进程, 每种模式 {seconds:g} 秒")
+    print("=" * 50)
+
+    default = run(False, seconds, readers, writers)
+    tuned = run(True, seconds, readers, writers)
+
+    default_writes = len(default['write'][0])
+    tuned_writes = len(tuned['write'][0])
+    if default_writes:
+        print(f"\n写吞吐: {tuned_writes / default_writes:.1f} 倍")
+    if tuned['read'][1] or tuned['write'][1]:
+        print("\n✗ 调优后仍出现锁错误")
+        return False
+    print("\n✓ 调优后没有锁错误")
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+静态资源构建脚本
+在部署时运行，输出到 static_build/（不修改 static/ 下的源文件）:
+- CSS/JS/图片/字体生成带内容哈希的文件名，HTML/CSS/JS 中的引用改写为哈希文件名
+- 可压缩文件生成 .gz 和 .br（需安装 brotli）预压缩版本
+- manifest.json 记录原路径到哈希路径的映射，由 asset_server 读取
+"""
+import sys
+import os
+import gzip
+import hashlib
+import json
+import re
+import shutil
+from datetime import datetime
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asset_server import BUILD_DIR, MANIFEST_NAME, COMPRESSIBLE_EXTENSIONS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT_DIR, 'static')
+
+# 生成哈希文件名的资源类型
+HASHED_EXTENSIONS = {'.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico',
+                     '.tiff', '.woff', '.woff2', '.ttf'}
+# 内容中的资源引用需要改写的类型（HTML 另外处理）
+REWRITE_EXTENSIONS = {'.css', '.js'}
+# 不参与构建的目录（上传文件已按内容哈希命名）
+SKIP_DIRS = {'uploads'}
+HASH_LENGTH = 10
+MIN_SAVING = 0.05  # 压缩后至少小 5% 才保留压缩版本
+
+# 以引号或括号包围的站内绝对路径，可带 ?v= 之类的查询参数
+_URL_PATTERN = re.compile(r'''(["'(])(/static/|/)([^"'()?#\s]+)(\?[^"'()#\s]*)?(?=["')])''')
+
+
+def iter_static_files():
+    """遍历 static 下需要构建的文件，返回相对路径（/ 分隔）"""
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        rel_dir = os.path.relpath(dirpath, STATIC_DIR)
+        if rel_dir == '.':
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for filename in filenames:
+            rel = os.path.normpath(os.path.join(rel_dir, filename)).replace(os.sep, '/')
+            yield rel
+
+
+def hashed_name(rel, data):
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(rel)
+    return f'{base}.{digest}{ext}'
+
+
+def write_output(out_dir, rel, data):
+    """写入构建目录，并按需生成预压缩版本；返回写入的压缩版本数"""
+    path = os.path.join(out_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    if os.path.splitext(rel)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return 0
+
+    variants = 0
+    # mtime=0 保证同样的内容得到同样的压缩结果
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data) * (1 - MIN_SAVING):
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        variants += 1
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data) * (1 - MIN_SAVING):
+            with open(path + '.br', 'wb') as f:
+                f.write(compressed)
+            variants += 1
+    return variants
+
+
+def rewrite_references(html, assets):
+    """把 HTML/CSS/JS 中引用的资源改写为带哈希的路径"""
+    def replace(match):
+        quote, prefix, rel, query = match.groups()
+        hashed = assets.get(rel)
+        if hashed is None:
+            return match.group(0)
+        return f'{quote}{prefix}{hashed}'
+    return _URL_PATTERN.sub(replace, html)
+
+
+def build():
+    """构建静态资源"""
+    print("=" * 50)
+    print("构建静态资源")
+    print("=" * 50)
+
+    out_dir = os.path.join(ROOT_DIR, BUILD_DIR)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    files = sorted(iter_static_files())
+    assets = {}
+    variants = 0
+
+    # 先处理图片等不引用其他资源的文件，CSS/JS 中的引用改写后再计算哈希
+    hashed_files = [rel for rel in files if os.path.splitext(rel)[1].lower() in HASHED_EXTENSIONS]
+    hashed_files.sort(key=lambda rel: os.path.splitext(rel)[1].lower() in REWRITE_EXTENSIONS)
+    for rel in hashed_files:
+        with open(os.path.join(STATIC_DIR, rel), 'rb') as f:
+            data = f.read()
+        if os.path.splitext(rel)[1].lower() in REWRITE_EXTENSIONS:
+            data = rewrite_references(data.decode('utf-8'), assets).encode('utf-8')
+        assets[rel] = hashed_name(rel, data)
+        variants += write_output(tmp_dir, assets[rel], data)
+    print(f"✓ 哈希资源: {len(assets)} 个")
+
+    pages = []
+    for rel in files:
+        if not rel.endswith('.html'):
+            continue
+        with open(os.path.join(STATIC_DIR, rel), encoding='utf-8') as f:
+            html = f.read()
+        variants += write_output(tmp_dir, rel, rewrite_references(html, assets).encode('utf-8'))
+        pages.append(rel)
+    print(f"✓ HTML 页面: {len(pages)} 个")
+    print(f"✓ 预压缩文件: {variants} 个" + ("" if brotli else "（未安装 brotli，只生成 gzip）"))
+
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({
+            'built_at': datetime.utcnow().isoformat(),
+            'assets': assets,
+            'pages': pages
+        }, f, ensure_ascii=False, indent=2)
+
+    # 整体替换，运行中的服务不会读到一半的构建结果
+    old_dir = out_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"\n✓ 构建完成: {out_dir}")
+    return True
+
+
+if __name__ == '__main__':
+    success = build()
+    sys.exit(0 if success else 1)
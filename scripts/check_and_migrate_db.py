@@ -20,6 +20,8 @@ EXPECTED_SCHEMA = {
         'category': 'VARCHAR(100)',
         'summary': 'VARCHAR(500)',
         'content': 'TEXT',
+        'content_hash': 'VARCHAR(64)',
+        'content_html': 'TEXT',
         'thumbnail': 'VARCHAR(255)',
         'author': 'VARCHAR(100)',
         'tags': 'VARCHAR(255)',
@@ -27,22 +29,88 @@ EXPECTED_SCHEMA = {
         'view_count': 'INTEGER',
         'created_at': 'DATETIME',
         'updated_at': 'DATETIME',
+    },
+    'booking': {
+        'id': 'INTEGER',
+        'name': 'VARCHAR(100)',
+        'dept': 'VARCHAR(100)',
+        'date': 'DATE',
+        'start_time': 'TIME',
+        'end_time': 'TIME',
+        'series_id': 'INTEGER',
+        'created_at': 'DATETIME',
+    },
+    'gomoku_room': {
+        'id': 'INTEGER',
+        'room_code': 'VARCHAR(6)',
+        'creator_name': 'VARCHAR(50)',
+        'status': 'VARCHAR(20)',
+        'board_state': 'TEXT',
+        'board_size': 'INTEGER',
+        'current_turn': 'VARCHAR(10)',
+        'winner': 'VARCHAR(50)',
+        'move_count': 'INTEGER',
+        'version': 'INTEGER',
+        'created_at': 'DATETIME',
+        'updated_at': 'DATETIME',
+    },
+    'upload_session': {
+        'id': 'VARCHAR(32)',
+        'filename': 'VARCHAR(255)',
+        'size': 'BIGINT',
+        'chunk_size': 'INTEGER',
+        'total_chunks': 'INTEGER',
+        'sha256': 'VARCHAR(64)',
+        'status': 'VARCHAR(20)',
+        'created_at': 'DATETIME',
     }
 }
 
+# 期望存在的索引: 索引名 -> (表名, [列名])
+EXPECTED_INDEXES = {
+    'ix_gomoku_move_room_number': ('gomoku_move', ['room_id', 'move_number']),
+    'ix_visitor_visit_time': ('visitor', ['visit_time']),
+    'ix_message_created_at': ('message', ['created_at']),
+    'ix_blog_post_published_created': ('blog_post', ['is_published', 'created_at', 'id']),
+    'ix_blog_post_category_published': ('blog_post', ['category', 'is_published', 'created_at', 'id']),
+    'ix_blog_post_updated_at': ('blog_post', ['updated_at']),
+    'ix_booking_date_start_end': ('booking', ['date', 'start_time', 'end_time']),
+    'ix_booking_series_id': ('booking', ['series_id']),
+}
+
+# 新增列后需要执行的数据回填
+BACKFILL_SQL = {
+    ('gomoku_room', 'move_count'):
+        'UPDATE gomoku_room SET move_count = '
+        '(SELECT COUNT(*) FROM gomoku_move WHERE gomoku_move.room_id = gomoku_room.id)',
+}
+
+# 新增列的默认值（None 表示不加 DEFAULT，已有行为 NULL）；未列出的列按类型补默认值
+COLUMN_DEFAULTS = {
+    ('booking', 'series_id'): None,  # 外键，不属于周期预约时为 NULL
+    ('upload_session', 'status'): "'uploading'",  # 已有的上传会话都在上传中
+}
+
 def check_and_migrate():
     """检查数据库完整性并进行必要的迁移"""
     with app.app_context():
         try:
-            inspector = inspect(db.engine)
-            tables = inspector.get_table_names()
-            
             print("=" * 50)
             print("数据库完整性检查")
             print("=" * 50)
             
             migration_needed = False
             
+            # app.py 启动时建表早于预约等蓝图的导入，新增的表在这里创建
+            existing_tables = set(inspect(db.engine).get_table_names())
+            db.create_all()
+            inspector = inspect(db.engine)
+            tables = inspector.get_table_names()
+            created_tables = sorted(set(tables) - existing_tables)
+            if created_tables:
+                migration_needed = True
+                print(f"\n✓ 创建缺失的表: {', '.join(created_tables)}")
+            
             for table_name, expected_columns in EXPECTED_SCHEMA.items():
                 if table_name not in tables:
                     print(f"\n⚠️  表 '{table_name}' 不存在，跳过检查")
@@ -70,13 +138,20 @@ def check_and_migrate():
                                 # 构建 ALTER TABLE 语句
                                 # 为某些类型添加默认值
                                 default_clause = ""
-                                if col_type == 'INTEGER':
+                                if (table_name, col_name) in COLUMN_DEFAULTS:
+                                    default = COLUMN_DEFAULTS[(table_name, col_name)]
+                                    if default is not None:
+                                        default_clause = f" DEFAULT {default}"
+                                elif col_type == 'INTEGER':
                                     default_clause = " DEFAULT 0"
                                 elif col_type == 'BOOLEAN':
                                     default_clause = " DEFAULT 1"
                                 
                                 sql = f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}{default_clause}"
                                 conn.execute(db.text(sql))
+                                backfill = BACKFILL_SQL.get((table_name, col_name))
+                                if backfill:
+                                    conn.execute(db.text(backfill))
                                 conn.commit()
                                 print(f"    ✓ 添加列: {col_name} ({col_type})")
                             except Exception as e:
@@ -84,6 +159,51 @@ def check_and_migrate():
                 else:
                     print(f"  ✓ 所有列完整")
             
+            print(f"\n检查索引")
+            for index_name, (table_name, index_columns) in EXPECTED_INDEXES.items():
+                if table_name not in tables:
+                    continue
+                existing_indexes = {idx['name'] for idx in inspector.get_indexes(table_name)}
+                if index_name in existing_indexes:
+                    continue
+                
+                migration_needed = True
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(db.text(
+                            f"CREATE INDEX IF NOT EXISTS {index_name} "
+                            f"ON {table_name} ({', '.join(index_columns)})"
+                        ))
+                        conn.commit()
+                    print(f"  ✓ 创建索引: {index_name}")
+                except Exception as e:
+                    print(f"  ✗ 创建索引 {index_name} 失败: {e}")
+            
+            # 访问量汇总表为空但已有访客记录时，从原始记录回填
+            if 'visitor_daily' in tables and 'visitor' in tables:
+                has_rollups = db.session.execute(db.text('SELECT 1 FROM visitor_daily LIMIT 1')).first()
+                has_visitors = db.session.execute(db.text('SELECT 1 FROM visitor LIMIT 1')).first()
+                if has_visitors and not has_rollups:
+                    from models_visitor import rebuild_visitor_rollups
+                    migration_needed = True
+                    total = rebuild_visitor_rollups()
+                    print(f"\n✓ 已根据 {total} 条访客记录回填访问量汇总表")
+            
+            # 标签索引表为空但文章有标签或分类时，从文章表回填
+            if 'post_tag' in tables and 'category' in tables:
+                has_index = db.session.execute(db.text(
+                    'SELECT 1 FROM post_tag UNION ALL SELECT 1 FROM category LIMIT 1'
+                )).first()
+                has_taxonomy = db.session.execute(db.text(
+                    "SELECT 1 FROM blog_post WHERE COALESCE(tags, '') != '' "
+                    "OR COALESCE(category, '') != '' LIMIT 1"
+                )).first()
+                if has_taxonomy and not has_index:
+                    from models_blog import rebuild_taxonomy
+                    migration_needed = True
+                    tag_total, category_total = rebuild_taxonomy()
+                    print(f"\n✓ 已回填标签和分类索引表: {tag_total} 个标签, {category_total} 个分类")
+            
             print("\n" + "=" * 50)
             if migration_needed:
                 print("✓ 数据库迁移完成")
@@ -31,33 +31,294 @@ def show_stats():
         for m in recent_messages:
             print(f"  - {m.name}: {m.content[:50]}...")
 
+# 清理/归档时每批处理的记录数，控制单个事务的大小
+BATCH_SIZE = 5000
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archive')
+
 def clear_old_visitors(days=30):
-    """清理旧访客记录"""
+    """清理旧访客记录（分批删除，避免长时间锁库）"""
+    with app.app_context():
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        deleted = 0
+        while True:
+            result = db.session.execute(db.text(
+                'DELETE FROM visitor WHERE id IN '
+                '(SELECT id FROM visitor WHERE visit_time < :cutoff ORDER BY visit_time LIMIT :limit)'
+            ), {'cutoff': cutoff_date, 'limit': BATCH_SIZE})
+            db.session.commit()
+            if result.rowcount == 0:
+                break
+            deleted += result.rowcount
+            print(f"  已删除 {deleted} 条...")
+        print(f"✓ 已清理 {deleted} 条 {days} 天前的访客记录")
+
+def archive_old_visitors(days=30, out_dir=ARCHIVE_DIR):
+    """
+    归档旧访客记录：按日期分目录写入 gzip 压缩的 JSONL 文件后分批删除
+
+    每批先写文件（写临时文件后原子替换）再删除对应记录，中断后重新运行即可继续。
+    文件按日期和固定的 id 区间（id // BATCH_SIZE）命名，写入时与已有文件按 id 合并，
+    重跑时同一条记录总是写入同一个文件且只出现一次
+    """
+    import gzip
+    import json
+    
     with app.app_context():
         cutoff_date = datetime.utcnow() - timedelta(days=days)
-        old_visitors = Visitor.query.filter(Visitor.visit_time < cutoff_date).delete()
-        db.session.commit()
-        print(f"✓ 已清理 {old_visitors} 条 {days} 天前的访客记录")
+        visitor = Visitor.__table__
+        remaining = db.session.query(db.func.count(Visitor.id))\
+            .filter(Visitor.visit_time < cutoff_date).scalar()
+        print(f"待归档 {remaining} 条 {days} 天前的访客记录 -> {out_dir}")
+        
+        archived = 0
+        while True:
+            rows = db.session.execute(
+                db.select(visitor)
+                .where(visitor.c.visit_time < cutoff_date)
+                .order_by(visitor.c.visit_time, visitor.c.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            
+            # 按日期和 id 区间分组写入
+            groups = {}
+            for row in rows:
+                key = (row.visit_time.strftime('%Y-%m-%d'), row.id // BATCH_SIZE * BATCH_SIZE)
+                groups.setdefault(key, []).append(row)
+            
+            for (day, first_id), group_rows in groups.items():
+                day_dir = os.path.join(out_dir, 'visitor', day)
+                os.makedirs(day_dir, exist_ok=True)
+                path = os.path.join(day_dir, f"visitor_{first_id}-{first_id + BATCH_SIZE - 1}.jsonl.gz")
+                
+                # 之前的批次或中断的运行已写入的记录
+                records = {}
+                if os.path.exists(path):
+                    with gzip.open(path, 'rt', encoding='utf-8') as f:
+                        for line in f:
+                            record = json.loads(line)
+                            records[record['id']] = record
+                for row in group_rows:
+                    records[row.id] = {
+                        'id': row.id,
+                        'ip_address': row.ip_address,
+                        'user_agent': row.user_agent,
+                        'visit_time': row.visit_time.isoformat(),
+                        'page': row.page
+                    }
+                
+                tmp_path = path + '.tmp'
+                with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                    for record_id in sorted(records):
+                        f.write(json.dumps(records[record_id], ensure_ascii=False))
+                        f.write('\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            
+            db.session.execute(
+                visitor.delete().where(visitor.c.id.in_([row.id for row in rows]))
+            )
+            db.session.commit()
+            
+            archived += len(rows)
+            print(f"  已归档 {archived}/{remaining} 条")
+        
+        print(f"✓ 已归档并删除 {archived} 条访客记录")
 
-def export_data():
-    """导出数据"""
+def render_posts():
+    """预先渲染所有博客文章的 HTML"""
     with app.app_context():
-        import json
+        from app import BlogPost
+        from blog_render import content_hash, render_markdown
         
-        visitors = [v.to_dict() for v in Visitor.query.all()]
-        messages = [m.to_dict() for m in Message.query.all()]
+        table = BlogPost.__table__
+        # Core 更新：渲染缓存不算修改，不触发 updated_at 的 onupdate
+        stmt = table.update()\
+            .where(table.c.id == db.bindparam('post_id'))\
+            .values(
+                content_html=db.bindparam('html'),
+                content_hash=db.bindparam('digest'),
+                updated_at=table.c.updated_at
+            )
         
-        data = {
-            'visitors': visitors,
-            'messages': messages,
-            'exported_at': datetime.utcnow().isoformat()
+        # 先读取所有文章的哈希（不读 HTML），再分批读取正文比对
+        known = {
+            row.id: (row.content_hash, row.missing)
+            for row in db.session.execute(db.select(
+                table.c.id, table.c.content_hash, table.c.content_html.is_(None).label('missing')
+            ))
         }
+        post_ids = sorted(known)
+        
+        rendered = 0
+        for i in range(0, len(post_ids), 50):
+            ids = post_ids[i:i + 50]
+            batch = []
+            for post_id, content in db.session.execute(
+                db.select(table.c.id, table.c.content).where(table.c.id.in_(ids))
+            ):
+                digest = content_hash(content)
+                stored_hash, missing = known[post_id]
+                if stored_hash == digest and not missing:
+                    continue
+                batch.append({'post_id': post_id, 'html': render_markdown(content), 'digest': digest})
+            if batch:
+                db.session.execute(stmt, batch)
+                db.session.commit()
+                rendered += len(batch)
+        print(f"✓ 已渲染 {rendered} 篇文章")
+
+def reindex_search():
+    """重建全文搜索索引"""
+    with app.app_context():
+        import search_index
+        if not search_index.is_enabled():
+            print("✗ 当前 SQLite 不支持 FTS5，全文搜索不可用")
+            return
+        posts, projects = search_index.rebuild_search_index()
+        print(f"✓ 已重建搜索索引: {posts} 篇文章, {projects} 个项目")
+
+def rebuild_tags():
+    """重建博客标签和分类索引表"""
+    with app.app_context():
+        from models_blog import rebuild_taxonomy
+        tags, categories = rebuild_taxonomy()
+        print(f"✓ 已重建标签索引: {tags} 个标签, {categories} 个分类")
+
+def process_media():
+    """为未处理完成的上传图片生成缩放图和 WebP 版本"""
+    with app.app_context():
+        from media_pipeline import process_pending_media
+        count = process_pending_media()
+        print(f"✓ 已处理 {count} 张图片")
+
+def rebuild_rollups():
+    """根据访客记录重建访问量汇总表"""
+    with app.app_context():
+        from models_visitor import rebuild_visitor_rollups
+        total = rebuild_visitor_rollups()
+        print(f"✓ 已根据 {total} 条访客记录重建汇总表")
+
+# 导出/导入的表（按外键依赖顺序），以及导出时排除的列
+EXPORT_TABLES = [
+    ('visitor', ()),
+    ('visitor_hourly', ()),
+    ('visitor_daily', ()),
+    ('message', ()),
+    ('blog_post', ()),
+    ('tag', ()),
+    ('category', ()),
+    ('post_tag', ()),
+    ('project', ()),
+    ('media_file', ()),
+    ('admin', ('password_hash',)),
+    ('gomoku_room', ()),
+    ('gomoku_player', ()),
+    ('gomoku_move', ()),
+    ('booking_series', ()),
+    ('booking', ()),
+]
+# 缺少必需列、无法还原的表
+IMPORT_SKIP_TABLES = {'admin'}
+
+def _open_backup(path, mode):
+    import gzip
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def export_data(path=None):
+    """流式导出所有表到 JSONL 文件（.gz 结尾时 gzip 压缩），内存占用与表大小无关"""
+    import json
+    import models_admin, models_gomoku  # noqa: F401 注册模型
+    
+    with app.app_context():
+        if path is None:
+            path = f"backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jsonl.gz"
+        
+        tables = db.metadata.tables
+        with _open_backup(path, 'w') as f:
+            f.write(json.dumps({'exported_at': datetime.utcnow().isoformat(), 'format': 'jsonl'}) + '\n')
+            for table_name, excluded in EXPORT_TABLES:
+                table = tables[table_name]
+                columns = [c for c in table.columns if c.name not in excluded]
+                result = db.session.execute(
+                    db.select(*columns),
+                    execution_options={'yield_per': BATCH_SIZE}
+                )
+                count = 0
+                for row in result:
+                    record = {
+                        name: value.isoformat() if hasattr(value, 'isoformat') else value
+                        for name, value in row._mapping.items()
+                    }
+                    f.write(json.dumps({'table': table_name, 'row': record}, ensure_ascii=False))
+                    f.write('\n')
+                    count += 1
+                print(f"  {table_name}: {count} 条")
+        
+        print(f"✓ 数据已导出到 {path}")
+
+def import_data(path):
+    """流式导入 export 生成的备份文件，按批插入，已存在的主键会跳过"""
+    import json
+    from datetime import date, time
+    import models_admin, models_gomoku  # noqa: F401 注册模型
+    
+    with app.app_context():
+        tables = db.metadata.tables
+        
+        # 各列的反序列化函数
+        parsers = {}
+        for table_name, _ in EXPORT_TABLES:
+            parsers[table_name] = {}
+            for column in tables[table_name].columns:
+                if isinstance(column.type, db.DateTime):
+                    parsers[table_name][column.name] = datetime.fromisoformat
+                elif isinstance(column.type, db.Date):
+                    parsers[table_name][column.name] = date.fromisoformat
+                elif isinstance(column.type, db.Time):
+                    parsers[table_name][column.name] = time.fromisoformat
         
-        filename = f"backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        counts = {}
+        batch_table, batch = None, []
         
-        print(f"✓ 数据已导出到 {filename}")
+        def flush():
+            if batch:
+                db.session.execute(tables[batch_table].insert().prefix_with('OR IGNORE'), batch)
+                db.session.commit()
+                counts[batch_table] = counts.get(batch_table, 0) + len(batch)
+                batch.clear()
+        
+        with _open_backup(path, 'r') as f:
+            for line in f:
+                item = json.loads(line)
+                table_name = item.get('table')
+                if table_name is None or table_name in IMPORT_SKIP_TABLES:
+                    continue
+                
+                if table_name != batch_table or len(batch) >= BATCH_SIZE:
+                    flush()
+                    batch_table = table_name
+                
+                row = item['row']
+                for name, parse in parsers[table_name].items():
+                    if row.get(name) is not None:
+                        row[name] = parse(row[name])
+                batch.append(row)
+            flush()
+        
+        # 导入的文章和标签不经过 API，需要让各进程的文章列表缓存失效
+        if counts.keys() & {'blog_post', 'tag', 'category', 'post_tag'}:
+            from models_blog import bump_listing_version
+            bump_listing_version()
+            db.session.commit()
+        
+        for table_name, count in counts.items():
+            print(f"  {table_name}: {count} 条")
+        print(f"✓ 已从 {path} 导入数据（{', '.join(sorted(IMPORT_SKIP_TABLES))} 表不导入）")
 
 def show_help():
     """显示帮助信息"""
@@ -67,7 +328,15 @@ def show_help():
 用法:
   python manage_db.py stats              显示统计信息
   python manage_db.py clear [days]       清理指定天数前的访客记录（默认30天）
-  python manage_db.py export             导出数据到JSON文件
+  python manage_db.py archive [days] [dir]
+                                         归档指定天数前的访客记录到压缩文件后删除（默认30天，目录 archive/）
+  python manage_db.py export [file]      流式导出所有表到JSONL文件（.gz结尾时压缩）
+  python manage_db.py import <file>      从导出文件批量导入数据
+  python manage_db.py rollup             根据访客记录重建访问量汇总表
+  python manage_db.py render             预先渲染所有博客文章的 HTML
+  python manage_db.py reindex            重建全文搜索索引（导入数据后需执行）
+  python manage_db.py tags               根据文章重建标签和分类索引表及文章数
+  python manage_db.py media              处理未完成的上传图片（生成缩放图和 WebP）
   python manage_db.py help               显示此帮助信息
     """)
 
@@ -83,8 +352,27 @@ if __name__ == '__main__':
     elif command == 'clear':
         days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
         clear_old_visitors(days)
+    elif command == 'archive':
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+        out_dir = sys.argv[3] if len(sys.argv) > 3 else ARCHIVE_DIR
+        archive_old_visitors(days, out_dir)
     elif command == 'export':
-        export_data()
+        export_data(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif command == 'import':
+        if len(sys.argv) < 3:
+            show_help()
+            sys.exit(1)
+        import_data(sys.argv[2])
+    elif command == 'rollup':
+        rebuild_rollups()
+    elif command == 'render':
+        render_posts()
+    elif command == 'reindex':
+        reindex_search()
+    elif command == 'tags':
+        rebuild_tags()
+    elif command == 'media':
+        process_media()
     elif command == 'help':
         show_help()
     else:
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+根据 gomoku_move 记录重建五子棋房间的落子计数器（move_count）
+"""
+import sys
+import os
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models_gomoku import GomokuRoom, GomokuMove
+
+
+def repair_counters(dry_run=False):
+    """重建所有房间的 move_count"""
+    with app.app_context():
+        actual_counts = dict(
+            db.session.query(GomokuMove.room_id, db.func.count(GomokuMove.id))
+            .group_by(GomokuMove.room_id)
+            .all()
+        )
+
+        fixed = 0
+        for room in GomokuRoom.query.all():
+            actual = actual_counts.get(room.id, 0)
+            if room.move_count != actual:
+                print(f"  - 房间 {room.room_code}: {room.move_count} -> {actual}")
+                room.move_count = actual
+                fixed += 1
+
+        if dry_run:
+            db.session.rollback()
+            print(f"✓ 检查完成，{fixed} 个房间的计数器不一致（未修改）")
+        else:
+            db.session.commit()
+            print(f"✓ 已修复 {fixed} 个房间的计数器")
+
+
+if __name__ == '__main__':
+    repair_counters(dry_run='--dry-run' in sys.argv[1:])
@@ -0,0 +1,206 @@
+"""
+博客文章和项目的全文搜索索引（SQLite FTS5）
+
+FTS5 的 unicode61 分词器会把连续的中文当作一个词，因此写入索引前在每个
+中日韩字符两侧插入分隔符 SEPARATOR（按单字切分），查询时把中文词转换为相邻单字的短语，
+相当于对中文做子串匹配。分隔符为控制字符，生成摘要片段时只去掉它，原文中的空格保留
+"""
+from database import db
+from sqlalchemy.exc import OperationalError
+import html
+import logging
+import re
+
+SEPARATOR = '\x1f'  # unicode61 视为分隔符；原文中的该字符在写入索引前去掉
+_CJK = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+_CJK_CHAR = re.compile(f'([{_CJK}])')
+
+# 索引表名带格式版本，分词方式变化时改名，启动时建新表重建索引并删除旧表
+POST_INDEX = 'blog_post_fts_v2'
+PROJECT_INDEX = 'project_fts_v2'
+_OLD_INDEXES = ('blog_post_fts', 'project_fts')  # 以空格分隔中文的旧索引
+
+# 各索引列及 bm25 权重
+POST_COLUMNS = (('title', 10.0), ('summary', 5.0), ('content', 1.0), ('category', 3.0), ('tags', 3.0))
+PROJECT_COLUMNS = (('title', 10.0), ('description', 2.0))
+
+SNIPPET_TOKENS = 24  # 摘要片段长度（词数）
+
+_enabled = None
+
+
+def segment(text):
+    """在中日韩字符两侧插入 SEPARATOR"""
+    text = (text or '').replace(SEPARATOR, '')
+    return _CJK_CHAR.sub(f'{SEPARATOR}\\1{SEPARATOR}', text)
+
+
+def _unsegment_snippet(snippet):
+    """去掉 segment 插入的分隔符，并把高亮标记转换为 <mark>"""
+    snippet = snippet.replace(SEPARATOR, '').replace('\x03\x02', '')
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def build_match_query(q):
+    """把用户输入转换为 FTS5 查询：每个词作为带前缀匹配的短语，词之间为 AND"""
+    phrases = []
+    for term in q.split():
+        tokens = segment(term).replace(SEPARATOR, ' ').split()
+        if tokens:
+            phrases.append('"' + ' '.join(tokens).replace('"', '""') + '"*')
+    return ' AND '.join(phrases)
+
+
+def is_enabled():
+    """当前 SQLite 是否支持 FTS5"""
+    return bool(_enabled)
+
+
+def _is_fts5_missing(error):
+    return isinstance(error, OperationalError) and 'no such module: fts5' in str(error.orig)
+
+
+def init_search_index():
+    """
+    创建索引表（需在应用上下文中调用）；新建时从现有数据构建索引
+
+    多个 gunicorn worker 同时启动时都会执行，建表和删除旧表均可重复执行；
+    只有 SQLite 不支持 FTS5 时关闭搜索
+    """
+    global _enabled
+    try:
+        tables = set(db.inspect(db.engine).get_table_names())
+        created = False
+        for name, columns in ((POST_INDEX, POST_COLUMNS), (PROJECT_INDEX, PROJECT_COLUMNS)):
+            if name not in tables:
+                db.session.execute(db.text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+                    f"{', '.join(c for c, _ in columns)}, tokenize='unicode61')"
+                ))
+                created = True
+        for name in _OLD_INDEXES:
+            if name in tables:
+                db.session.execute(db.text(f'DROP TABLE IF EXISTS {name}'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if _is_fts5_missing(e):
+            _enabled = False
+            logging.error(f'SQLite 不支持 FTS5，全文搜索不可用: {e}')
+            return
+        # 其他错误（如数据库暂时被锁）：索引表已由其他 worker 建好时照常使用
+        tables = set(db.inspect(db.engine).get_table_names())
+        _enabled = {POST_INDEX, PROJECT_INDEX} <= tables
+        logging.error(f'创建全文搜索索引表失败: {e}')
+        return
+
+    _enabled = True
+    if created:
+        try:
+            rebuild_search_index()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f'重建全文搜索索引失败，请执行 manage_db.py reindex: {e}')
+
+
+def _replace(table, rowid, values):
+    db.session.execute(db.text(f'DELETE FROM {table} WHERE rowid = :rowid'), {'rowid': rowid})
+    columns = ', '.join(values)
+    params = ', '.join(f':{c}' for c in values)
+    db.session.execute(
+        db.text(f'INSERT INTO {table} (rowid, {columns}) VALUES (:rowid, {params})'),
+        dict(values, rowid=rowid)
+    )
+
+
+def index_post(post):
+    """更新一篇文章的索引（与文章修改在同一事务中，由调用方提交）"""
+    if not _enabled:
+        return
+    _replace(POST_INDEX, post.id, {
+        'title': segment(post.title),
+        'summary': segment(post.summary),
+        'content': segment(post.content),
+        'category': segment(post.category),
+        'tags': segment((post.tags or '').replace(',', ' '))
+    })
+
+
+def remove_post(post_id):
+    if _enabled:
+        db.session.execute(db.text(f'DELETE FROM {POST_INDEX} WHERE rowid = :rowid'), {'rowid': post_id})
+
+
+def index_project(project):
+    """更新一个项目的索引（由调用方提交）"""
+    if not _enabled:
+        return
+    _replace(PROJECT_INDEX, project.id, {
+        'title': segment(project.title),
+        'description': segment(project.description)
+    })
+
+
+def remove_project(project_id):
+    if _enabled:
+        db.session.execute(db.text(f'DELETE FROM {PROJECT_INDEX} WHERE rowid = :rowid'), {'rowid': project_id})
+
+
+def rebuild_search_index():
+    """
+    根据文章和项目表重建全部索引
+
+    Returns:
+        (文章数, 项目数)
+    """
+    from app import BlogPost
+
+    db.session.execute(db.text(f'DELETE FROM {POST_INDEX}'))
+    posts = 0
+    for post in BlogPost.query.yield_per(100):
+        index_post(post)
+        posts += 1
+
+    projects = 0
+    db.session.execute(db.text(f'DELETE FROM {PROJECT_INDEX}'))
+    if 'project' in db.inspect(db.engine).get_table_names():
+        from models_admin import Project
+        for project in Project.query.yield_per(100):
+            index_project(project)
+            projects += 1
+
+    db.session.commit()
+    return posts, projects
+
+
+def _search(table, source_table, visible_clause, columns, q, limit, offset):
+    weights = ', '.join(str(w) for _, w in columns)
+    rows = db.session.execute(db.text(
+        f"SELECT f.rowid, snippet({table}, -1, char(2), char(3), '…', {SNIPPET_TOKENS}), "
+        f"bm25({table}, {weights}) AS score "
+        f"FROM {table} f JOIN {source_table} s ON s.id = f.rowid "
+        f"WHERE {table} MATCH :q AND {visible_clause} "
+        f"ORDER BY score LIMIT :limit OFFSET :offset"
+    ), {'q': q, 'limit': limit, 'offset': offset}).all()
+    return [(rowid, _unsegment_snippet(snippet), score) for rowid, snippet, score in rows]
+
+
+def search_posts(q, limit=10, offset=0):
+    """
+    搜索已发布的文章
+
+    Returns:
+        [(文章id, 高亮片段HTML, bm25分数), ...]，按相关度排序
+    """
+    match = build_match_query(q)
+    if not match:
+        return []
+    return _search(POST_INDEX, 'blog_post', 's.is_published = 1', POST_COLUMNS, match, limit, offset)
+
+
+def search_projects(q, limit=10, offset=0):
+    """搜索可见的项目，返回格式同 search_posts"""
+    match = build_match_query(q)
+    if not match:
+        return []
+    return _search(PROJECT_INDEX, 'project', 's.is_visible = 1', PROJECT_COLUMNS, match, limit, offset)
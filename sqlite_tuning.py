@@ -0,0 +1,172 @@
+"""
+SQLite 连接调优
+- 每个新连接设置 busy_timeout、WAL、synchronous=NORMAL、cache_size、mmap_size：
+  WAL 模式下读不阻塞写、写不阻塞读，写锁冲突时等待而不是立即报 database is locked
+- 连接池参数按多个 gunicorn worker（每个进程各自一个连接池）配置，fork 后子进程丢弃继承的连接
+- 后台线程定期执行 wal_checkpoint 和 PRAGMA optimize
+非 SQLite 数据库时不做任何处理
+"""
+from database import db
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+import atexit
+import logging
+import os
+import threading
+
+BUSY_TIMEOUT_MS = 5000  # 等待写锁的最长时间
+CACHE_SIZE_KIB = 16384  # 每个连接的页缓存（16MB）
+MMAP_SIZE = 256 * 1024 * 1024  # 内存映射读取的最大字节数
+POOL_SIZE = 8  # 每个进程常驻的连接数
+POOL_OVERFLOW = 8  # 高峰时额外允许的连接数
+POOL_TIMEOUT = 10  # 秒，等待空闲连接的最长时间
+
+MAINTENANCE_INTERVAL = 600  # 秒
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024  # WAL 文件超过该大小时用 TRUNCATE 模式回收空间
+
+# 顺序有关：先设 busy_timeout，切换 WAL 需要的锁被占用时会等待
+PRAGMAS = (
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -CACHE_SIZE_KIB),
+    ('mmap_size', MMAP_SIZE),
+)
+
+_SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+
+
+def is_file_sqlite(uri):
+    """是否为 SQLite 文件数据库（内存数据库使用 SQLAlchemy 默认的单连接池）"""
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS，需在 db.init_app 之前设置"""
+    if not is_file_sqlite(uri):
+        return {}
+    return {
+        'connect_args': {
+            'timeout': BUSY_TIMEOUT_MS / 1000,
+            'check_same_thread': False  # 连接由连接池在线程间复用
+        },
+        'pool_size': POOL_SIZE,
+        'max_overflow': POOL_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+    }
+
+
+def apply_pragmas(dbapi_connection):
+    """对 sqlite3 连接设置 PRAGMAS（journal_mode 写入数据库文件，其余只对该连接有效）"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in PRAGMAS:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+class SQLiteTuning:
+    """为 Flask-SQLAlchemy 的引擎设置 PRAGMA，并在后台定期维护"""
+
+    def __init__(self, interval=MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self.engine = None
+        self.last_maintenance = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        """在 db.init_app 之后调用"""
+        if not is_file_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+            return
+        with app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, 'connect', self._on_connect)
+        # gunicorn 预加载后 fork：子进程不能使用父进程打开的 SQLite 连接
+        os.register_at_fork(after_in_child=self._after_fork)
+        app.before_request(self._ensure_thread)
+        atexit.register(self.stop)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection)
+
+    def _after_fork(self):
+        # close=False：不关闭父进程仍在使用的连接，只让子进程的连接池重新建立连接
+        self.engine.dispose(close=False)
+
+    def run_maintenance(self):
+        """
+        执行 wal_checkpoint 和 PRAGMA optimize
+
+        Returns:
+            本次结果，同时保存在 last_maintenance 中
+        """
+        wal_path = self.engine.url.database + '-wal'
+        wal_bytes = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        # PASSIVE 不等待读写；TRUNCATE 会等待正在进行的读事务，只在 WAL 文件过大时使用
+        mode = 'TRUNCATE' if wal_bytes > WAL_TRUNCATE_BYTES else 'PASSIVE'
+        with self.engine.connect() as conn:
+            busy, log_pages, checkpointed = conn.exec_driver_sql(f'PRAGMA wal_checkpoint({mode})').first()
+            conn.exec_driver_sql('PRAGMA optimize')
+        result = {
+            'time': datetime.utcnow().isoformat(),
+            'checkpoint_mode': mode,
+            'wal_bytes_before': wal_bytes,
+            'checkpoint_busy': bool(busy),
+            'wal_pages': log_pages,
+            'checkpointed_pages': checkpointed
+        }
+        self.last_maintenance = result
+        return result
+
+    def stats(self, connection):
+        """当前连接实际生效的设置、连接池状态和上次维护结果，非 SQLite 时返回 None"""
+        if self.engine is None:
+            return None
+
+        def pragma(name):
+            return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+        return {
+            'journal_mode': pragma('journal_mode'),
+            'synchronous': _SYNCHRONOUS_NAMES.get(pragma('synchronous')),
+            'busy_timeout_ms': pragma('busy_timeout'),
+            'cache_size': pragma('cache_size'),
+            'mmap_size': pragma('mmap_size'),
+            'pool': self.engine.pool.status(),
+            'maintenance_interval': self.interval,
+            'last_maintenance': self.last_maintenance
+        }
+
+    def stop(self):
+        """停止后台线程"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+
+    def _ensure_thread(self):
+        # gunicorn 预加载后 fork 的子进程中线程不存在，需要重新启动
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='sqlite-maintenance', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                logging.error(f'SQLite 维护失败: {e}')
+
+
+sqlite_tuning = SQLiteTuning()
@@ -0,0 +1,99 @@
+"""
+博客浏览量异步累加
+阅读文章时只在内存中计数，由后台线程定期合并写入数据库
+"""
+from database import db
+from collections import Counter
+import atexit
+import logging
+import os
+import threading
+
+FLUSH_INTERVAL = 5  # 秒，进程异常退出时最多丢失这段时间内的浏览量
+
+
+class ViewCounter:
+    """浏览量聚合器：按文章累计增量，定期每篇文章执行一次 view_count = view_count + n"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.app = None
+        self.table = None
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+    def init_app(self, app, table):
+        """绑定 Flask 应用和文章表"""
+        self.app = app
+        self.table = table
+        atexit.register(self.stop)
+
+    def hit(self, post_id):
+        """记录一次浏览"""
+        self._ensure_thread()
+        with self._lock:
+            self._pending[post_id] += 1
+
+    def pending(self, post_id):
+        """尚未写入数据库的浏览量"""
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """把累计的浏览量写入数据库"""
+        with self._flush_lock:
+            # 取出并清零，写入失败时再加回，保证不重复也不丢失
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            if not pending:
+                return
+
+            table = self.table
+            stmt = table.update()\
+                .where(table.c.id == db.bindparam('post_id'))\
+                .values(
+                    view_count=db.func.coalesce(table.c.view_count, 0) + db.bindparam('n'),
+                    updated_at=table.c.updated_at  # 浏览不算修改，不触发 onupdate
+                )
+            with self.app.app_context():
+                try:
+                    db.session.execute(stmt, [
+                        {'post_id': post_id, 'n': n} for post_id, n in pending.items()
+                    ])
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    with self._lock:
+                        self._pending.update(pending)
+                    logging.error(f'写入浏览量失败: {e}')
+
+    def stop(self):
+        """停止后台线程并写入剩余浏览量"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _ensure_thread(self):
+        # gunicorn 预加载后 fork 的子进程中线程不存在，需要重新启动
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending.clear()  # fork 前父进程的计数由父进程负责写入
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+
+view_counter = ViewCounter()
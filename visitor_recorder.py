@@ -0,0 +1,134 @@
+"""
+访客记录缓冲写入
+首页请求只把访客信息放入内存队列，由后台线程批量写入数据库
+"""
+from database import db
+from datetime import datetime
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+BATCH_SIZE = 200  # 攒够多少条写一次
+FLUSH_INTERVAL = 0.5  # 秒，最长等待多久写一次
+MAX_QUEUE = 10000  # 队列上限，超出后丢弃并计数
+
+
+class VisitorRecorder:
+    """访客记录器：有界队列 + 后台批量写入线程"""
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.app = None
+        self.table = None
+        self.on_flush = None
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+    def init_app(self, app, table, on_flush=None):
+        """
+        绑定 Flask 应用和访客表
+
+        on_flush(rows) 在批量插入后、提交前调用，用于同一事务内维护汇总数据
+        """
+        self.app = app
+        self.table = table
+        self.on_flush = on_flush
+        atexit.register(self.stop)
+
+    def record(self, ip_address, user_agent, page='/'):
+        """记录一次访问（不阻塞）"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait({
+                'ip_address': ip_address,
+                'user_agent': (user_agent or '')[:255] or None,
+                'page': page,
+                'visit_time': datetime.utcnow()
+            })
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped
+        }
+
+    def flush(self):
+        """把队列中已有的记录全部写入数据库"""
+        while self._flush_batch(block=False):
+            pass
+
+    def stop(self):
+        """停止后台线程并写入剩余记录"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _ensure_thread(self):
+        # gunicorn 预加载后 fork 的子进程中线程不存在，需要重新启动
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='visitor-recorder', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._flush_batch(block=True)
+
+    def _flush_batch(self, block):
+        """取出至多 batch_size 条记录写入；返回写入条数"""
+        rows = []
+        try:
+            if block:
+                # 收到第一条后最多再等 flush_interval 秒攒批
+                rows.append(self._queue.get(timeout=self.flush_interval))
+                deadline = time.monotonic() + self.flush_interval
+                while len(rows) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    rows.append(self._queue.get(timeout=remaining))
+            else:
+                while len(rows) < self.batch_size:
+                    rows.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if not rows:
+            return 0
+
+        with self._flush_lock, self.app.app_context():
+            try:
+                db.session.execute(self.table.insert(), rows)
+                if self.on_flush is not None:
+                    self.on_flush(rows)
+                db.session.commit()
+                self.written += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.dropped += len(rows)
+                logging.error(f'写入访客记录失败: {e}')
+        return len(rows)
+
+
+visitor_recorder = VisitorRecorder()